@@ -1,40 +1,220 @@
 #!/usr/bin/env python
 # app.py
-import os
 import json
+import atexit
+import signal
 import logging
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
+import functools
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime
+from flask import Flask, Response, request, jsonify
+from werkzeug.exceptions import BadRequest
+from settings import get_config
+from log_config import configure_logging, request_log
 
 # Load configuration from .env (if present)
-load_dotenv()
+config = get_config()
 
-logging.basicConfig(level=logging.DEBUG)
+# Structured logs at LOG_LEVEL (default INFO); per-request messages are sampled.
+configure_logging()
 app = Flask(__name__)
 
-from db_helpers import insert_raw_payload
+from db_helpers import DUPLICATE, DEDUP_SCHEMA_ERROR, has_dedup_index, insert_raw_row
 from dag_trigger import maybe_trigger_dag
-from helius_api import update_or_create_webhook
+from ingest_buffer import BufferFull, writer_from_env, buffering_enabled, durable_acks
+from payload_codec import raw_body_enabled, strict_validation, validate_body, row_from_env
+from dedup import dedup_enabled, payload_key, get_cache
+from metrics import (timed, count_error, count_request, record_payload, render_metrics,
+                     metrics_status, profile_request, DUPLICATES)
+
+# Deliveries larger than WEBHOOK_MAX_BYTES are rejected with 413 (0: no limit).
+app.config["MAX_CONTENT_LENGTH"] = config.max_body_bytes or None
+
+# Write-behind buffer, created lazily per process when WEBHOOK_BUFFERED is set.
+_writer = None
+_writer_lock = threading.Lock()
+
+def _trigger_for_batch(ids, count):
+    # Queue the committed batch for the next coalesced Airflow DAG run
+    maybe_trigger_dag({"raw_ids": ids} if ids else {})
+
+def get_writer():
+    """
+    Returns the process-wide buffered writer, starting its flusher thread on
+    first use. Returns None unless WEBHOOK_BUFFERED is enabled.
+    """
+    global _writer
+    if not buffering_enabled():
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = writer_from_env(on_commit=_trigger_for_batch)
+                writer.start()
+                atexit.register(writer.stop)
+                _writer = writer
+    return _writer
+
+def _read_row():
+    """
+    Builds the helius_hook row for the current request. With WEBHOOK_RAW_BODY
+    the body bytes are stored as received (after a cheap validity check)
+    instead of being parsed and re-serialized. With WEBHOOK_DEDUP the row
+    carries a 'payload_hash' dedup key. Raises ValueError (or BadRequest when
+    parsed by Flask) for bodies that are not JSON.
+    """
+    if raw_body_enabled():
+        body = request.get_data(cache=False)
+        validate_body(body, strict=strict_validation())
+        row = row_from_env(body)
+    else:
+        payload = request.get_json()
+        body = request.get_data()
+        row = {"payload": json.dumps(payload), "received_at": datetime.utcnow()}
+    record_payload(body)
+    if dedup_enabled():
+        row["payload_hash"] = payload_key(body)
+    return row
+
+def _record_db_duplicate(key):
+    get_cache().record_db_duplicate(key)
+    DUPLICATES.labels("db").inc()
+
+def _duplicate_response():
+    request_log.info("Duplicate webhook delivery acknowledged without storing.")
+    return jsonify({"status": "duplicate"}), 200
+
+def _cache_key_when_committed(future, key):
+    """
+    Caches the dedup key from the flusher thread once the buffered row's
+    batch commits. If the write fails, the key stays uncached, so Helius'
+    retry is stored instead of being acked as a duplicate.
+    """
+    def done(future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        if future.result() is DUPLICATE:
+            _record_db_duplicate(key)
+        else:
+            get_cache().add(key)
+    future.add_done_callback(done)
+
+def _buffered_response(writer, row):
+    try:
+        future = writer.submit_row(row)
+    except BufferFull:
+        logging.warning("Ingestion queue full; rejecting webhook delivery.")
+        return jsonify({"error": "Ingestion queue is full"}), 503
+    except RuntimeError as e:
+        logging.error("Rejecting webhook delivery: %s", e)
+        return jsonify({"error": str(e)}), 503
+    key = row.get("payload_hash")
+    if key is not None:
+        _cache_key_when_committed(future, key)
+    if not durable_acks():
+        return jsonify({"status": "queued"}), 202
+    try:
+        raw_id = future.result(timeout=config.buffer_ack_timeout)
+    except FutureTimeout:
+        if future.cancel():
+            # Dropped from the queue, so Helius' retry will not store a copy.
+            logging.error("Buffered write not committed within %ss; dropped it.",
+                          config.buffer_ack_timeout)
+            return jsonify({"error": "Failed to insert raw payload"}), 500
+        # Already in a batch being written: the row will still be committed.
+        logging.warning("Buffered write still committing after %ss; acknowledging as queued.",
+                        config.buffer_ack_timeout)
+        return jsonify({"status": "queued"}), 202
+    except Exception as e:
+        logging.error("Buffered write was not committed: %s", e)
+        return jsonify({"error": "Failed to insert raw payload"}), 500
+    if raw_id is DUPLICATE:
+        return _duplicate_response()
+    return jsonify({"status": "success", "raw_id": raw_id}), 200
+
+def profiled(view):
+    """
+    Runs the view under cProfile when WEBHOOK_PROFILING is enabled and the
+    request carries an X-Profile header.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if config.profiling and request.headers.get("X-Profile"):
+            with profile_request(view.__name__, config.profile_dir):
+                return view(*args, **kwargs)
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.after_request
+def _count_response(response):
+    if request.endpoint == "webhook_listener":
+        count_request(response.status_code)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    status = metrics_status(config, request.headers.get("Authorization"))
+    if status == 404:
+        return jsonify({"error": "Not found"}), 404
+    if status == 401:
+        return jsonify({"error": "Unauthorized"}), 401
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
 
 @app.route('/webhooks', methods=['POST'])
+@profiled
 def webhook_listener():
-    payload = request.get_json()
-    raw_id = insert_raw_payload(payload)
+    try:
+        with timed("parse"):
+            row = _read_row()
+    except (ValueError, BadRequest) as e:
+        count_error("parse")
+        request_log.warning("Rejecting invalid webhook payload: %s", e)
+        return jsonify({"error": "Invalid JSON payload"}), 400
+    key = row.get("payload_hash")
+    if key is not None and get_cache().seen(key):
+        DUPLICATES.labels("cache").inc()
+        request_log.info("Duplicate webhook delivery acknowledged without storing.")
+        return jsonify({"status": "duplicate"}), 200
+    writer = get_writer()
+    if writer is not None:
+        return _buffered_response(writer, row)
+    raw_id = insert_raw_row(row)
     if raw_id is None:
         return jsonify({"error": "Failed to insert raw payload"}), 500
-    # Trigger the Airflow DAG (with rate limiting: max once per minute)
+    if raw_id is DUPLICATE:
+        _record_db_duplicate(key)
+        return _duplicate_response()
+    if key is not None:
+        get_cache().add(key)
+    # Queue the raw_id for the next coalesced Airflow DAG run (non-blocking)
     maybe_trigger_dag({"raw_id": raw_id})
     return jsonify({"status": "success", "raw_id": raw_id}), 200
 
+def _exit_on_sigterm(signum, frame):
+    # Unwinds app.run() as Ctrl-C does, so the atexit hooks (which drain the
+    # buffered writer) run before the process exits.
+    raise SystemExit(0)
+
 def main():
-    new_url = os.getenv("NEW_WEBHOOK_URL")
+    from helius_api import start_periodic_sync
+
+    # docker stop and systemd send SIGTERM, which skips atexit by default.
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    new_url = config.new_webhook_url
     if not new_url:
         logging.error("NEW_WEBHOOK_URL is not set. Ensure your ngrok script exports it.")
         return
+    # Without the index every deduplicated insert would fail with a 500.
+    if dedup_enabled() and has_dedup_index() is False:
+        logging.error(DEDUP_SCHEMA_ERROR)
+        return
     logging.info("Using NEW_WEBHOOK_URL: %s", new_url)
-    update_or_create_webhook(new_url)
-    logging.info("Starting Flask listener on port %s", os.getenv("PORT", "5000"))
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5000")))
+    # Sync the webhook addresses now and every HELIUS_SYNC_INTERVAL seconds
+    start_periodic_sync(new_url)
+    logging.info("Starting Flask listener on port %s", config.port)
+    app.run(host="0.0.0.0", port=config.port)
 
 if __name__ == "__main__":
     main()
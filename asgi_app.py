@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# asgi_app.py
+import os
+import json
+import asyncio
+import time
+import logging
+from datetime import datetime
+import asyncpg
+from settings import get_config
+from dag_trigger import maybe_trigger_dag
+from db_helpers import DUPLICATE, DEDUP_INDEX_QUERY, DEDUP_SCHEMA_ERROR
+from payload_codec import raw_body_enabled, strict_validation, validate_body, row_from_env
+from dedup import dedup_enabled, payload_key, get_cache
+from log_config import configure_logging, request_log
+from metrics import (timed, observe, count_error, count_request, record_payload, render_metrics,
+                     metrics_status, profile_request, DUPLICATES)
+
+# Per-process resources, created in the lifespan startup handler.
+_pool = None
+
+ROW_COLUMNS = ("payload", "payload_raw", "payload_encoding", "payload_hash", "received_at")
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+def asyncpg_dsn(database_url):
+    """
+    Converts a SQLAlchemy URL (e.g. postgresql+psycopg2://...) into a DSN that
+    asyncpg accepts.
+    """
+    scheme, sep, rest = database_url.partition("://")
+    return f"{scheme.split('+', 1)[0]}{sep}{rest}"
+
+
+async def startup():
+    global _pool
+    configure_logging()
+    config = get_config()
+    if not config.database_url:
+        raise RuntimeError("DATABASE_URL is not set.")
+    _pool = await asyncpg.create_pool(
+        asyncpg_dsn(config.database_url),
+        min_size=config.db_pool_min_size,
+        max_size=config.db_pool_size + config.db_max_overflow,
+        command_timeout=config.db_command_timeout,
+    )
+    # Without the index every deduplicated insert would fail with a 500.
+    if dedup_enabled() and not await _pool.fetchval(DEDUP_INDEX_QUERY):
+        await shutdown()
+        raise RuntimeError(DEDUP_SCHEMA_ERROR)
+    logging.info("ASGI listener started (pid %s)", os.getpid())
+
+
+async def shutdown():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+async def insert_raw_row_async(row):
+    """
+    Async counterpart of db_helpers.insert_raw_row. Takes a prebuilt
+    helius_hook row and returns the inserted id, DUPLICATE if its
+    payload_hash is already stored, or None on error.
+    """
+    columns = [name for name in ROW_COLUMNS if name in row]
+    placeholders = ", ".join(f"${i}" for i in range(1, len(columns) + 1))
+    conflict = " ON CONFLICT (payload_hash) DO NOTHING" if "payload_hash" in row else ""
+    query = (f"INSERT INTO helius_hook ({', '.join(columns)}, processed) "
+             f"VALUES ({placeholders}, false){conflict} RETURNING id")
+    start = time.perf_counter()
+    try:
+        async with _pool.acquire(timeout=get_config().db_pool_timeout) as connection:
+            observe("pool_wait", time.perf_counter() - start)
+            inserted_id = await connection.fetchval(query, *(row[name] for name in columns))
+        if inserted_id is None:
+            request_log.info("Skipped duplicate raw payload")
+            return DUPLICATE
+        request_log.info("Inserted raw payload with id %s", inserted_id)
+        return inserted_id
+    # InterfaceError covers connections lost mid-query; TimeoutError a pool
+    # checkout or query that ran past its timeout.
+    except (asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError, OSError) as e:
+        count_error("insert")
+        logging.error("Error inserting raw payload: %s", e)
+        return None
+    finally:
+        observe("insert", time.perf_counter() - start)
+
+
+async def read_body(receive, max_bytes=0):
+    """
+    Reads the full request body. Raises PayloadTooLarge once it exceeds
+    max_bytes (0: no limit).
+    """
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise PayloadTooLarge()
+        chunks.append(chunk)
+        more_body = message.get("more_body", False)
+    return b"".join(chunks)
+
+
+async def send_response(send, status, body, content_type):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, status, data):
+    await send_response(send, status, json.dumps(data).encode(), "application/json")
+
+
+async def webhook_listener(receive, send):
+    try:
+        body = await read_body(receive, get_config().max_body_bytes)
+    except PayloadTooLarge:
+        await send_json(send, 413, {"error": "Payload too large"})
+        return
+    try:
+        with timed("parse"):
+            if raw_body_enabled():
+                validate_body(body, strict=strict_validation())
+                row = row_from_env(body)
+            else:
+                row = {"payload": json.dumps(json.loads(body)), "received_at": datetime.utcnow()}
+    except ValueError:
+        count_error("parse")
+        await send_json(send, 400, {"error": "Invalid JSON payload"})
+        return
+    record_payload(body)
+    key = None
+    if dedup_enabled():
+        key = row["payload_hash"] = payload_key(body)
+        if get_cache().seen(key):
+            DUPLICATES.labels("cache").inc()
+            request_log.info("Duplicate webhook delivery acknowledged without storing.")
+            await send_json(send, 200, {"status": "duplicate"})
+            return
+    raw_id = await insert_raw_row_async(row)
+    if raw_id is None:
+        await send_json(send, 500, {"error": "Failed to insert raw payload"})
+        return
+    if raw_id is DUPLICATE:
+        get_cache().record_db_duplicate(key)
+        DUPLICATES.labels("db").inc()
+        request_log.info("Duplicate webhook delivery acknowledged without storing.")
+        await send_json(send, 200, {"status": "duplicate"})
+        return
+    if key is not None:
+        get_cache().add(key)
+    # Queue the raw_id for the next coalesced Airflow DAG run (non-blocking)
+    maybe_trigger_dag({"raw_id": raw_id})
+    await send_json(send, 200, {"status": "success", "raw_id": raw_id})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await startup()
+            except Exception as e:
+                logging.error("ASGI startup failed: %s", e)
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """
+    ASGI entry point serving the same /webhooks contract as the Flask app.
+    """
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    config = get_config()
+    if scope["path"] == "/metrics" and scope["method"] == "GET":
+        authorization = dict(scope["headers"]).get(b"authorization", b"").decode("latin-1")
+        status = metrics_status(config, authorization)
+        if status == 404:
+            await send_json(send, 404, {"error": "Not found"})
+        elif status == 401:
+            await send_json(send, 401, {"error": "Unauthorized"})
+        else:
+            body, content_type = render_metrics()
+            await send_response(send, 200, body, content_type)
+        return
+    if scope["path"] != "/webhooks":
+        await send_json(send, 404, {"error": "Not found"})
+        return
+    if scope["method"] != "POST":
+        await send_json(send, 405, {"error": "Method not allowed"})
+        return
+
+    async def send_counted(message):
+        if message["type"] == "http.response.start":
+            count_request(message["status"])
+        await send(message)
+
+    if config.profiling and any(name == b"x-profile" for name, _ in scope["headers"]):
+        # The event loop keeps serving other requests meanwhile, so the
+        # profile includes their work too.
+        with profile_request("webhook_listener", config.profile_dir):
+            await webhook_listener(receive, send_counted)
+        return
+    await webhook_listener(receive, send_counted)
+
+
+def main():
+    import uvicorn
+    from helius_api import start_periodic_sync
+
+    configure_logging()
+    new_url = get_config().new_webhook_url
+    if not new_url:
+        logging.error("NEW_WEBHOOK_URL is not set. Ensure your ngrok script exports it.")
+        return
+    logging.info("Using NEW_WEBHOOK_URL: %s", new_url)
+    # Sync the webhook addresses now and every HELIUS_SYNC_INTERVAL seconds
+    start_periodic_sync(new_url)
+    port = get_config().port
+    workers = get_config().asgi_workers
+    logging.info("Starting ASGI listener on port %s with %s worker(s)", port, workers)
+    uvicorn.run("asgi_app:app", host="0.0.0.0", port=port, workers=workers,
+                log_level="info", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
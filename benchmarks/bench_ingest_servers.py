@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# benchmarks/bench_ingest_servers.py
+"""
+Load test comparing the Flask (app.py) and ASGI (asgi_app.py) /webhooks
+listeners. Postgres and Airflow are replaced by local stubs:
+
+  - the DB insert is stubbed with a fixed sleep (--db-latency) that mimics a
+    round trip to Postgres, returning an increasing id;
+  - Airflow is a local HTTP server that answers every DAG run with 200 after
+    --airflow-latency seconds.
+
+Each server runs in its own subprocess so the load generator does not share
+its GIL. Usage:
+
+    python benchmarks/bench_ingest_servers.py --requests 5000 --concurrency 64
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import itertools
+import statistics
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sample_payloads import make_body
+
+def run_airflow_stub(port, latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            body = b'{"state": "queued"}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve_flask(port, db_latency):
+    import logging
+    from werkzeug.serving import make_server
+    import app as flask_app
+
+    logging.disable(logging.INFO)
+    counter = itertools.count(1)
+
+    def insert_stub(row):
+        time.sleep(db_latency)
+        return next(counter)
+
+    flask_app.insert_raw_row = insert_stub
+    make_server("127.0.0.1", port, flask_app.app, threaded=True).serve_forever()
+
+
+def serve_asgi(port, db_latency):
+    import logging
+    import uvicorn
+    import asgi_app
+
+    logging.disable(logging.INFO)
+    counter = itertools.count(1)
+
+    async def startup_stub():
+        pass
+
+    async def insert_stub(row):
+        await asyncio.sleep(db_latency)
+        return next(counter)
+
+    asgi_app.startup = startup_stub
+    asgi_app.insert_raw_row_async = insert_stub
+    uvicorn.run(asgi_app.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+async def wait_for_port(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+async def generate_load(port, total, concurrency):
+    import httpx
+
+    url = f"http://127.0.0.1:{port}/webhooks"
+    body = make_body(transactions=5)
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker(client):
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, content=body,
+                                             headers={"Content-Type": "application/json"})
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def benchmark(kind, args, port):
+    command = [sys.executable, os.path.abspath(__file__), "--serve", kind,
+               "--port", str(port), "--db-latency", str(args.db_latency)]
+    server = subprocess.Popen(command, env=os.environ.copy())
+    try:
+        asyncio.run(wait_for_port(port))
+        asyncio.run(generate_load(port, min(200, args.requests), args.concurrency))  # warm-up
+        return asyncio.run(generate_load(port, args.requests, args.concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    parser.add_argument("--airflow-latency", type=float, default=0.05)
+    parser.add_argument("--trigger-interval", type=float, default=0.1)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--serve", choices=["flask", "asgi"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve == "flask":
+        serve_flask(args.port, args.db_latency)
+        return
+    if args.serve == "asgi":
+        serve_asgi(args.port, args.db_latency)
+        return
+
+    airflow_port = args.port + 100
+    airflow = run_airflow_stub(airflow_port, args.airflow_latency)
+    os.environ["AIRFLOW_DAG_RUN_URL"] = f"http://127.0.0.1:{airflow_port}/dagRuns"
+    os.environ["DAG_TRIGGER_INTERVAL"] = str(args.trigger_interval)
+    os.environ.setdefault("DATABASE_URL", "postgresql://stub/stub")
+
+    results = {}
+    for offset, kind in enumerate(("flask", "asgi")):
+        results[kind] = benchmark(kind, args, args.port + offset)
+    airflow.shutdown()
+
+    print(f"{'server':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for kind, result in results.items():
+        print(f"{kind:<8}{result['rps']:>10.0f}{result['p50_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}{result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# benchmarks/bench_payload_storage.py
+"""
+Micro-benchmark of the per-request payload handling cost, without a database:
+
+  - parse+dumps: request.get_json() followed by json.dumps() (the original path)
+  - raw: the cheap validity check plus decoding the body as text (WEBHOOK_RAW_BODY)
+  - raw+strict: raw with a full parse for validation (orjson when installed)
+  - raw+gzip / raw+zstd: raw with compressed storage
+
+Reports mean CPU time per payload and peak allocated memory (tracemalloc) for
+payloads of 1, 10 and 100 enhanced transactions. Usage:
+
+    python benchmarks/bench_payload_storage.py --iterations 200
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import payload_codec
+from payload_codec import validate_body, build_raw_row
+from sample_payloads import make_body
+
+
+def parse_and_dump(body):
+    return {"payload": json.dumps(json.loads(body))}
+
+
+def raw(body):
+    validate_body(body)
+    return build_raw_row(body)
+
+
+def raw_strict(body):
+    validate_body(body, strict=True)
+    return build_raw_row(body)
+
+
+def raw_gzip(body):
+    validate_body(body)
+    return build_raw_row(body, "gzip")
+
+
+def raw_zstd(body):
+    validate_body(body)
+    return build_raw_row(body, "zstd")
+
+
+def measure(func, body, iterations):
+    func(body)  # warm-up
+    start = time.process_time()
+    for _ in range(iterations):
+        func(body)
+    cpu = (time.process_time() - start) / iterations
+
+    tracemalloc.start()
+    func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = [("parse+dumps", parse_and_dump), ("raw", raw), ("raw+strict", raw_strict),
+             ("raw+gzip", raw_gzip)]
+    if payload_codec.zstandard is not None:
+        cases.append(("raw+zstd", raw_zstd))
+    print(f"orjson: {'yes' if payload_codec.orjson else 'no'}, "
+          f"zstandard: {'yes' if payload_codec.zstandard else 'no'}")
+
+    print(f"{'txs':>5} {'bytes':>9} {'mode':<12}{'cpu us':>10}{'peak KiB':>10}{'stored':>10}")
+    for transactions in (1, 10, 100):
+        body = make_body(transactions)
+        for name, func in cases:
+            cpu, peak = measure(func, body, args.iterations)
+            row = func(body)
+            stored = len(row.get("payload_raw") or row["payload"])
+            print(f"{transactions:>5} {len(body):>9} {name:<12}{cpu * 1e6:>10.1f}"
+                  f"{peak / 1024:>10.1f}{stored:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# benchmarks/bench_startup.py
+"""
+Measures worker cold-start cost: the time a fresh interpreter needs to import
+the listener modules. It compares the working tree against a baseline git ref
+(extracted with `git archive`). Each import runs in a new process; the
+interpreter's own startup time is subtracted, and the slowest imports are
+listed from `python -X importtime`. Usage:
+
+    python benchmarks/bench_startup.py --baseline-ref <ref> --runs 10
+    python benchmarks/bench_startup.py --baseline-ref <ref> --env-vars 2000
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import tarfile
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ("db_helpers", "app", "asgi_app")
+
+
+def time_import(tree, module, runs, env):
+    """
+    Returns the median seconds to run `import module` in a fresh interpreter,
+    or None if the import fails in that tree.
+    """
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", f"import {module}"], cwd=tree, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+        if result.returncode != 0:
+            return None
+    return statistics.median(samples)
+
+
+def slowest_imports(tree, module, env, top=5):
+    """
+    Returns [(cumulative_us, name)] for the slowest top-level imports
+    reported by -X importtime.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=tree, env=env, capture_output=True, text=True)
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, _, rest = line.partition(":")
+        _, cumulative, name = (part.strip() for part in rest.split("|"))
+        # Top-level imports are not indented under another import.
+        if name == name.lstrip():
+            entries.append((int(cumulative), name))
+    return sorted(entries, reverse=True)[:top]
+
+
+def extract_ref(ref, target):
+    archive = subprocess.run(["git", "archive", ref], cwd=ROOT, capture_output=True, check=True)
+    with tempfile.TemporaryFile() as handle:
+        handle.write(archive.stdout)
+        handle.seek(0)
+        with tarfile.open(fileobj=handle) as tar:
+            tar.extractall(target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline-ref", help="git ref to compare against")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--env-vars", type=int, default=0,
+                        help="add this many dummy environment variables")
+    args = parser.parse_args()
+
+    env = os.environ.copy()
+    env.update({f"BENCH_DUMMY_{i}": "x" * 64 for i in range(args.env_vars)})
+
+    trees = [("current", ROOT)]
+    tmpdir = None
+    if args.baseline_ref:
+        tmpdir = tempfile.TemporaryDirectory()
+        extract_ref(args.baseline_ref, tmpdir.name)
+        trees.insert(0, (f"baseline ({args.baseline_ref})", tmpdir.name))
+
+    interpreter = time_import(ROOT, "sys", args.runs, env)
+    print(f"interpreter startup: {interpreter * 1000:.1f} ms (subtracted below)\n")
+    print(f"{'module':<12}" + "".join(f"{label:>28}" for label, _ in trees))
+    for module in MODULES:
+        cells = []
+        for _, tree in trees:
+            elapsed = time_import(tree, module, args.runs, env)
+            cells.append("n/a" if elapsed is None else f"{(elapsed - interpreter) * 1000:.1f} ms")
+        print(f"{module:<12}" + "".join(f"{cell:>28}" for cell in cells))
+
+    for label, tree in trees:
+        print(f"\nslowest imports for 'import app' ({label}):")
+        for cumulative, name in slowest_imports(tree, "app", env):
+            print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
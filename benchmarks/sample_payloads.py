@@ -0,0 +1,78 @@
+# benchmarks/sample_payloads.py
+"""
+Synthetic Helius enhanced-transaction payloads for the benchmarks. Each
+transaction mirrors the shape of a SWAP delivery: signature, slot, timestamp,
+fee payer, native/token transfers, account data and the swap event.
+"""
+import json
+import random
+import string
+
+SOL_MINT = "So11111111111111111111111111111111111111112"
+USDC_MINT = "EPjFWdd5AufqSSqeM2qN1xzybapC8G4wEGGkZwyTDt1v"
+_BASE58 = "".join(c for c in string.ascii_letters + string.digits if c not in "0OIl")
+
+
+def _key(rng, length=44):
+    return "".join(rng.choice(_BASE58) for _ in range(length))
+
+
+def make_transaction(rng, index=0):
+    fee_payer = _key(rng)
+    pool = _key(rng)
+    amount_in = round(rng.uniform(0.01, 50), 9)
+    amount_out = round(amount_in * rng.uniform(90, 200), 6)
+    return {
+        "description": f"{fee_payer} swapped {amount_in} SOL for {amount_out} USDC",
+        "type": "SWAP",
+        "source": "RAYDIUM",
+        "fee": 5000,
+        "feePayer": fee_payer,
+        "signature": _key(rng, 88),
+        "slot": 250000000 + index,
+        "timestamp": 1700000000 + index,
+        "nativeTransfers": [
+            {"fromUserAccount": fee_payer, "toUserAccount": pool,
+             "amount": int(amount_in * 1e9)},
+        ],
+        "tokenTransfers": [
+            {"fromUserAccount": fee_payer, "toUserAccount": pool,
+             "fromTokenAccount": _key(rng), "toTokenAccount": _key(rng),
+             "tokenAmount": amount_in, "mint": SOL_MINT, "tokenStandard": "Fungible"},
+            {"fromUserAccount": pool, "toUserAccount": fee_payer,
+             "fromTokenAccount": _key(rng), "toTokenAccount": _key(rng),
+             "tokenAmount": amount_out, "mint": USDC_MINT, "tokenStandard": "Fungible"},
+        ],
+        "accountData": [
+            {"account": _key(rng), "nativeBalanceChange": rng.randint(-10**9, 10**9),
+             "tokenBalanceChanges": []}
+            for _ in range(6)
+        ],
+        "transactionError": None,
+        "instructions": [
+            {"programId": _key(rng), "accounts": [_key(rng) for _ in range(8)],
+             "data": _key(rng, 64), "innerInstructions": []}
+            for _ in range(3)
+        ],
+        "events": {
+            "swap": {
+                "nativeInput": {"account": fee_payer, "amount": str(int(amount_in * 1e9))},
+                "tokenOutputs": [{"userAccount": fee_payer, "mint": USDC_MINT,
+                                  "rawTokenAmount": {"tokenAmount": str(int(amount_out * 1e6)),
+                                                     "decimals": 6}}],
+                "innerSwaps": [],
+            }
+        },
+    }
+
+
+def make_payload(transactions=1, seed=0):
+    """
+    Returns a list of `transactions` enhanced transactions, as Helius posts them.
+    """
+    rng = random.Random(seed)
+    return [make_transaction(rng, index) for index in range(transactions)]
+
+
+def make_body(transactions=1, seed=0):
+    return json.dumps(make_payload(transactions, seed)).encode()
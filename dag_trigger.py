@@ -1,58 +1,427 @@
 # dag_trigger.py
 import os
+import json
+import time
+import atexit
 import logging
-import requests
-from requests.auth import HTTPBasicAuth
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime
+from settings import get_config
+from metrics import (timed, count_error, DAG_TRIGGERS, DAG_TRIGGER_REQUESTS,
+                     DAG_TRIGGER_COALESCED)
 
-# Global variable to track the time of the last DAG trigger.
-last_trigger_time = None
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process window is available
+    fcntl = None
 
-def trigger_helius_dag(conf={}):
+# Minimum number of seconds between two DAG triggers.
+DEFAULT_TRIGGER_INTERVAL = 60
+
+# Most raw_ids sent (and kept in memory) per DAG run. Above this a run only
+# carries the min/max id range.
+DEFAULT_MAX_CONF_IDS = 1000
+
+# HTTP statuses worth retrying. 409 is treated as success: the dag_run_id
+# already exists, so an earlier attempt of the same run got through.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def build_dag_run(conf):
     """
-    Triggers the Airflow DAG by calling its REST API endpoint.
+    Builds the Airflow REST API request for a new DAG run.
+    Returns (endpoint, data, headers, (username, password)).
     """
-    dag_run_endpoint = "http://localhost:8080/api/v1/dags/helius_webhook_notification_dag/dagRuns"
-    airflow_username = os.getenv("AIRFLOW_USERNAME", "admin")
-    airflow_password = os.getenv("AIRFLOW_PASSWORD", "password")
-    
+    config = get_config()
+    dag_run_endpoint = config.airflow_dag_run_url
+    airflow_username = config.airflow_username
+    airflow_password = config.airflow_password
+
     headers = {
         "Content-Type": "application/json",
         "Accept": "application/json"
     }
-    
-    # Generate a unique dag_run_id with the current UTC time.
-    time_str = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-    dag_run_id = f"webhook_trigger_{time_str}"
-    
+
+    # Generate a unique dag_run_id with the current UTC time. Retries of the
+    # same run reuse it, so Airflow rejects duplicates with 409.
+    time_str = datetime.utcnow().strftime('%Y%m%dT%H%M%S%fZ')
+    dag_run_id = f"webhook_trigger_{time_str}_{os.getpid()}"
+
     data = {
         "dag_run_id": dag_run_id,
         "conf": conf
     }
-    
+    return dag_run_endpoint, data, headers, (airflow_username, airflow_password)
+
+def create_session(retries=3, backoff=0.5):
+    """
+    Returns a keep-alive requests.Session that retries connection errors and
+    retryable statuses with exponential backoff.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["POST"]),
+        raise_on_status=False,
+    )
+    session = requests.Session()
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=1)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def trigger_helius_dag(conf={}, session=None, timeout=None):
+    """
+    Triggers the Airflow DAG by calling its REST API endpoint.
+    Returns True if Airflow accepted the DAG run.
+    """
+    dag_run_endpoint, data, headers, auth = build_dag_run(conf)
+    session = session or create_session()
+    if timeout is None:
+        timeout = get_config().airflow_timeout
+
     try:
-        response = requests.post(
-            dag_run_endpoint,
-            json=data,
-            headers=headers,
-            auth=HTTPBasicAuth(airflow_username, airflow_password),
-        )
-        if response.status_code in [200, 201]:
+        with timed("dag_trigger"):
+            response = session.post(
+                dag_run_endpoint,
+                json=data,
+                headers=headers,
+                auth=auth,
+                timeout=timeout,
+            )
+        if response.status_code in [200, 201, 409]:
             logging.info("Successfully triggered Airflow DAG")
-        else:
-            logging.error("Failed to trigger Airflow DAG. Status code: %s, response: %s",
-                          response.status_code, response.text)
+            return True
+        logging.error("Failed to trigger Airflow DAG. Status code: %s, response: %s",
+                      response.status_code, response.text)
     except Exception as e:
         logging.error("Exception while triggering Airflow DAG: %s", e)
+    count_error("dag_trigger")
+    return False
+
+def build_conf(raw_ids, mode="list", max_ids=DEFAULT_MAX_CONF_IDS):
+    """
+    Builds the DAG run conf for the raw_ids coalesced into one trigger.
+    mode "list" sends every id, up to max_ids; mode "range" (and "list" above
+    max_ids) sends the min/max id and count. Both include "raw_id" (the
+    newest id) for DAGs that expect a single id.
+    """
+    raw_ids = sorted(set(raw_ids))
+    conf = {"raw_id": raw_ids[-1] if raw_ids else None, "count": len(raw_ids)}
+    if mode == "range" or len(raw_ids) > max_ids:
+        if raw_ids:
+            conf["min_raw_id"] = raw_ids[0]
+            conf["max_raw_id"] = raw_ids[-1]
+    else:
+        conf["raw_ids"] = raw_ids
+    return conf
+
+class PendingIds:
+    """
+    raw_ids waiting for a DAG run. Holds the ids themselves up to max_ids,
+    then collapses to their min, max and count (which may then include
+    repeats), so memory and the DAG conf stay bounded however long Airflow
+    is unavailable.
+    """
+
+    def __init__(self, max_ids=DEFAULT_MAX_CONF_IDS):
+        self.max_ids = max_ids
+        self.ids = set()
+        self.min_id = None
+        self.max_id = None
+        self.count = 0
+
+    def __len__(self):
+        return len(self.ids) if self.ids is not None else self.count
+
+    def _add_range(self, min_id, max_id, count):
+        self.min_id = min_id if self.min_id is None else min(self.min_id, min_id)
+        self.max_id = max_id if self.max_id is None else max(self.max_id, max_id)
+        self.count += count
+
+    def _collapse(self):
+        if self.ids is None:
+            return
+        ids, self.ids = self.ids, None
+        if ids:
+            self._add_range(min(ids), max(ids), len(ids))
+
+    def add(self, raw_ids):
+        raw_ids = [raw_id for raw_id in raw_ids if raw_id is not None]
+        if not raw_ids:
+            return
+        if self.ids is None:
+            self._add_range(min(raw_ids), max(raw_ids), len(raw_ids))
+            return
+        self.ids.update(raw_ids)
+        if len(self.ids) > self.max_ids:
+            self._collapse()
+
+    def merge(self, other):
+        if other.ids is not None:
+            self.add(other.ids)
+        elif other.count:
+            self._collapse()
+            self._add_range(other.min_id, other.max_id, other.count)
+
+    def conf(self, mode="list"):
+        if self.ids is not None:
+            return build_conf(self.ids, mode, self.max_ids)
+        return {"raw_id": self.max_id, "count": self.count,
+                "min_raw_id": self.min_id, "max_raw_id": self.max_id}
+
+    def to_state(self):
+        if self.ids is not None:
+            return {"pending": sorted(self.ids)}
+        return {"pending_range": [self.min_id, self.max_id, self.count]}
+
+    @classmethod
+    def from_state(cls, state, max_ids=DEFAULT_MAX_CONF_IDS):
+        pending = cls(max_ids)
+        pending.add(state.get("pending", []))
+        if state.get("pending_range"):
+            pending._collapse()
+            pending._add_range(*state["pending_range"])
+        return pending
+
+class FileTriggerGate:
+    """
+    Cross-process trigger window backed by an flock()ed state file, so that
+    N workers on one host trigger at most once per window between them.
+
+    The file holds the last trigger time and a spool of raw_ids submitted by
+    workers that were not allowed to trigger. Whichever worker next opens the
+    window takes the whole spool.
+    """
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise RuntimeError("File locks are not supported on this platform.")
+        self.path = path
+
+    def claim(self, pending, window, force=False):
+        """
+        Adds the PendingIds to the shared spool. If the window has elapsed,
+        claims the whole spool and returns (PendingIds, None); otherwise
+        returns (None, seconds until the window reopens). With an empty spool
+        this is a no-op returning (empty PendingIds, None) unless force is set.
+        """
+        with open(self.path, "a+") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                handle.seek(0)
+                try:
+                    state = json.loads(handle.read() or "{}")
+                except ValueError:
+                    state = {}
+                spool = PendingIds.from_state(state, pending.max_ids)
+                spool.merge(pending)
+                last_trigger = state.get("last_trigger", 0.0)
+                now = time.time()
+                if not len(spool) and not force:
+                    return spool, None
+                if now - last_trigger >= window:
+                    state = {"last_trigger": now}
+                    claimed = spool
+                    wait = None
+                else:
+                    state = dict(spool.to_state(), last_trigger=last_trigger)
+                    claimed = None
+                    wait = window - (now - last_trigger)
+                handle.seek(0)
+                handle.truncate()
+                handle.write(json.dumps(state))
+                handle.flush()
+                return claimed, wait
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+class TriggerDispatcher:
+    """
+    Background DAG trigger that never blocks the caller.
+
+    submit() records raw_ids; a worker thread sends at most one DAG run per
+    window carrying every raw_id received since the previous run. Failed
+    triggers are retried with backoff by the session and, if they still fail,
+    their ids are carried into the next window.
+    """
+
+    def __init__(self, window=DEFAULT_TRIGGER_INTERVAL, conf_mode="list", gate=None,
+                 timeout=10, retries=3, backoff=0.5, max_ids=DEFAULT_MAX_CONF_IDS):
+        self.window = window
+        self.conf_mode = conf_mode
+        self.gate = gate
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_ids = max_ids
+        self._pending = PendingIds(max_ids)
+        self._extra_conf = {}
+        self._requested = False
+        self._submitted = 0
+        self._spooled = False
+        self._last_trigger = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self._session = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="dag-trigger", daemon=True)
+        self._thread.start()
+
+    def submit(self, conf):
+        """
+        Queues the raw_id / raw_ids in conf for the next DAG run. Other conf
+        keys are passed through (the latest value wins). A conf without ids
+        still requests a run.
+        """
+        conf = dict(conf or {})
+        raw_ids = conf.pop("raw_ids", None) or []
+        raw_id = conf.pop("raw_id", None)
+        if raw_id is not None:
+            raw_ids = list(raw_ids) + [raw_id]
+        with self._cond:
+            self._pending.add(raw_ids)
+            self._extra_conf.update(conf)
+            self._requested = True
+            self._submitted += 1
+            self._cond.notify()
+        DAG_TRIGGER_REQUESTS.inc()
+
+    def stop(self, timeout=10):
+        """
+        Stops the worker thread after a last attempt to send (or spool) the
+        pending ids.
+        """
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _seconds_until_open(self):
+        if self._last_trigger is None:
+            return 0
+        return self._last_trigger + self.window - time.monotonic()
+
+    def _run(self):
+        self._session = create_session(self.retries, self.backoff)
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if self._requested or self._spooled:
+                        wait = self._seconds_until_open()
+                        if wait <= 0:
+                            break
+                        self._cond.wait(wait)
+                    else:
+                        self._cond.wait()
+                stopping = self._stopping
+                requested = self._requested
+                submitted = self._submitted
+                raw_ids = self._pending
+                extra_conf = self._extra_conf
+                self._pending = PendingIds(self.max_ids)
+                self._extra_conf = {}
+                self._requested = False
+                self._submitted = 0
+            self._dispatch(raw_ids, extra_conf, requested, submitted)
+            if stopping:
+                self._session.close()
+                return
+
+    def _dispatch(self, raw_ids, extra_conf, requested, submitted=0):
+        if self.gate is not None:
+            try:
+                claimed, wait = self.gate.claim(raw_ids, self.window, force=requested)
+            except OSError as e:
+                logging.error("Trigger lock unavailable, triggering locally: %s", e)
+                claimed, wait = raw_ids, None
+            if claimed is None:
+                # Another worker triggered within the window; our ids wait in
+                # the shared spool and we check again when it reopens.
+                logging.info("DAG trigger coalesced: %s raw_ids spooled for the next window.",
+                             len(raw_ids))
+                DAG_TRIGGERS.labels("spooled").inc()
+                DAG_TRIGGER_COALESCED.inc(submitted)
+                self._spooled = True
+                self._last_trigger = time.monotonic() + wait - self.window
+                return
+            self._spooled = False
+            raw_ids = claimed
+        if not raw_ids and not requested:
+            return
+
+        self._last_trigger = time.monotonic()
+        conf = raw_ids.conf(self.conf_mode)
+        conf.update(extra_conf)
+        if trigger_helius_dag(conf, session=self._session, timeout=self.timeout):
+            logging.info("Triggered Airflow DAG for %s coalesced raw_ids.", len(raw_ids))
+            DAG_TRIGGERS.labels("triggered").inc()
+            DAG_TRIGGER_COALESCED.inc(max(submitted - 1, 0))
+            return
+        DAG_TRIGGERS.labels("failed").inc()
+        with self._cond:
+            self._pending.merge(raw_ids)
+            self._requested = True
+            self._submitted += submitted
+            for key, value in extra_conf.items():
+                self._extra_conf.setdefault(key, value)
+
+def dispatcher_from_env():
+    """
+    Builds a TriggerDispatcher from the environment:
+      - DAG_TRIGGER_INTERVAL (default 60): coalescing window in seconds
+      - DAG_TRIGGER_CONF_MODE (default "list"): "list" or "range"
+      - DAG_TRIGGER_MAX_IDS (default 1000): most ids per run (and in memory);
+        above it a run carries the min/max range
+      - DAG_TRIGGER_LOCK_FILE: state file shared by all workers on the host
+      - AIRFLOW_TIMEOUT (default 10), AIRFLOW_RETRIES (default 3),
+        AIRFLOW_RETRY_BACKOFF (default 0.5)
+    """
+    config = get_config()
+    lock_file = config.dag_trigger_lock_file
+    return TriggerDispatcher(
+        window=config.dag_trigger_interval,
+        conf_mode=config.dag_trigger_conf_mode,
+        gate=FileTriggerGate(lock_file) if lock_file else None,
+        timeout=config.airflow_timeout,
+        retries=config.airflow_retries,
+        backoff=config.airflow_retry_backoff,
+        max_ids=config.dag_trigger_max_ids,
+    )
+
+# Process-wide dispatcher, created lazily (and recreated after a fork).
+_dispatcher = None
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    global _dispatcher, _dispatcher_pid
+    pid = os.getpid()
+    if _dispatcher is not None and _dispatcher_pid == pid:
+        return _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher_pid != pid:
+            dispatcher = dispatcher_from_env()
+            dispatcher.start()
+            atexit.register(dispatcher.stop)
+            _dispatcher = dispatcher
+            _dispatcher_pid = pid
+        return _dispatcher
 
 def maybe_trigger_dag(conf={}):
     """
-    Triggers the DAG only if at least one minute has passed since the last trigger.
+    Schedules a DAG run for the raw_id(s) in conf without blocking. All ids
+    received within DAG_TRIGGER_INTERVAL seconds are coalesced into one run.
     """
-    global last_trigger_time
-    now = datetime.utcnow()
-    if last_trigger_time is not None and (now - last_trigger_time) < timedelta(minutes=1):
-        logging.info("DAG trigger skipped: triggered less than a minute ago.")
-        return
-    last_trigger_time = now
-    trigger_helius_dag(conf)
+    get_dispatcher().submit(conf)
@@ -0,0 +1,181 @@
+# db_engine.py
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from settings import get_config
+from metrics import observe
+
+# Process-wide engine shared by every DB helper. Created lazily on first use.
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+# Pool metrics, updated from the pool event hooks and the connection helpers.
+_metrics_lock = threading.Lock()
+_metrics = {
+    "connects": 0,
+    "checkouts": 0,
+    "checkins": 0,
+    "invalidations": 0,
+    "wait_count": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+
+
+def pool_settings():
+    """
+    Returns the pool configuration read from the environment:
+      - DB_POOL_SIZE (default 5): connections kept open in the pool
+      - DB_MAX_OVERFLOW (default 10): extra connections allowed under burst load
+      - DB_POOL_TIMEOUT (default 30): seconds to wait for a free connection
+      - DB_POOL_RECYCLE (default 1800): seconds before a connection is replaced
+      - DB_POOL_PRE_PING (default true): test connections on checkout
+    """
+    config = get_config()
+    return {
+        "pool_size": config.db_pool_size,
+        "max_overflow": config.db_max_overflow,
+        "pool_timeout": config.db_pool_timeout,
+        "pool_recycle": config.db_pool_recycle,
+        "pool_pre_ping": config.db_pool_pre_ping,
+    }
+
+
+def _bump(key, amount=1):
+    with _metrics_lock:
+        _metrics[key] += amount
+
+
+def _register_pool_events(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        _bump("connects")
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        _bump("checkouts")
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        _bump("checkins")
+
+    @event.listens_for(engine, "invalidate")
+    def _on_invalidate(dbapi_connection, connection_record, exception):
+        _bump("invalidations")
+
+
+def get_engine():
+    """
+    Returns the process-wide SQLAlchemy engine, creating it on first use.
+    Returns None if DATABASE_URL is not set.
+
+    The engine is rebuilt after a fork (e.g. gunicorn/uwsgi pre-fork workers)
+    so that child processes never share the parent's pooled connections.
+    """
+    global _engine, _engine_pid
+    pid = os.getpid()
+    engine = _engine
+    if engine is not None and _engine_pid == pid:
+        return engine
+
+    with _engine_lock:
+        if _engine is not None and _engine_pid == pid:
+            return _engine
+        if _engine is not None:
+            # Inherited from the parent process: drop the pool without
+            # closing the parent's sockets.
+            _engine.dispose(close=False)
+            _engine = None
+
+        database_url = get_config().database_url
+        if not database_url:
+            logging.error("DATABASE_URL is not set.")
+            return None
+
+        # Imported here: SQLAlchemy is slow to import, and only needed once
+        # the first query runs.
+        from sqlalchemy import create_engine
+        settings = pool_settings()
+        engine = create_engine(database_url, **settings)
+        _register_pool_events(engine)
+        logging.info("Created DB engine with pool settings: %s", settings)
+        _engine = engine
+        _engine_pid = pid
+        return engine
+
+
+def dispose_engine():
+    """
+    Closes all pooled connections and forgets the engine. The next call to
+    get_engine() creates a fresh one.
+    """
+    global _engine, _engine_pid
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+        _engine = None
+        _engine_pid = None
+
+
+def _record_wait(elapsed):
+    observe("pool_wait", elapsed)
+    with _metrics_lock:
+        _metrics["wait_count"] += 1
+        _metrics["wait_seconds_total"] += elapsed
+        if elapsed > _metrics["wait_seconds_max"]:
+            _metrics["wait_seconds_max"] = elapsed
+
+
+@contextmanager
+def connect(engine=None):
+    """
+    Checks a connection out of the shared pool, recording how long the
+    checkout waited. Raises RuntimeError if no engine is available.
+    """
+    engine = engine or get_engine()
+    if engine is None:
+        raise RuntimeError("DATABASE_URL is not set.")
+    start = time.perf_counter()
+    connection = engine.connect()
+    _record_wait(time.perf_counter() - start)
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+@contextmanager
+def begin(engine=None):
+    """
+    Like connect(), but wraps the block in a transaction that is committed on
+    success and rolled back on error.
+    """
+    with connect(engine) as connection:
+        with connection.begin():
+            yield connection
+
+
+def pool_metrics():
+    """
+    Returns a snapshot of pool usage and checkout wait metrics, suitable for
+    sizing DB_POOL_SIZE / DB_MAX_OVERFLOW.
+    """
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    engine = _engine
+    if engine is not None and _engine_pid == os.getpid():
+        pool = engine.pool
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            getter = getattr(pool, name, None)
+            if callable(getter):
+                snapshot[f"pool_{name}"] = getter()
+    if snapshot["wait_count"]:
+        snapshot["wait_seconds_avg"] = snapshot["wait_seconds_total"] / snapshot["wait_count"]
+    else:
+        snapshot["wait_seconds_avg"] = 0.0
+    return snapshot
@@ -1,55 +1,166 @@
 # db_helpers.py
-import os
+import io
+import csv
 import json
+import time
 import logging
 from datetime import datetime
-from sqlalchemy import create_engine, text
-from sqlalchemy.exc import SQLAlchemyError
-from dotenv import load_dotenv, find_dotenv
+from functools import lru_cache
+from db_engine import get_engine, connect, begin
+from settings import get_config
+from metrics import timed, observe, count_error
+from log_config import request_log
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# SQLAlchemy is imported inside the functions that use it, after get_engine()
+# has loaded it: importing it takes about 0.3s, which every listener worker
+# would otherwise pay at start-up.
 
-# Find and load the .env file
-dotenv_path = find_dotenv()
-logging.info(f"Found .env file at: {dotenv_path}")
-load_dotenv(dotenv_path)
+@lru_cache(maxsize=None)
+def hook_table():
+    """
+    Returns the SQLAlchemy table() for helius_hook.
+    """
+    from sqlalchemy import table, column
+    return table(
+        "helius_hook",
+        column("id"),
+        column("payload"),
+        column("payload_raw"),
+        column("payload_encoding"),
+        column("payload_hash"),
+        column("received_at"),
+        column("processed"),
+        column("process_error"),
+    )
+
+# Returned in place of an id when the unique index on payload_hash shows the
+# payload was already stored.
+DUPLICATE = object()
+
+def _row_columns(rows):
+    # Only write the compressed-payload and dedup columns when they are in
+    # use, so tables without them keep working.
+    columns = ["payload", "received_at"]
+    if any(row.get("payload_encoding") for row in rows):
+        columns += ["payload_raw", "payload_encoding"]
+    if any(row.get("payload_hash") for row in rows):
+        columns.append("payload_hash")
+    return columns
+
+# information_schema data types that compare directly with a timestamp.
+TIMESTAMP_TYPES = ("timestamp without time zone", "timestamp with time zone", "date")
 
-# Debug environment variables
-logging.info(f"All environment variables: {dict(os.environ)}")
-database_url = os.getenv("DATABASE_URL")
-logging.info(f"DATABASE_URL from environment: {database_url}")
+def last_updated_is_timestamp(connection):
+    """
+    Returns True if helius_addresses.last_updated is a timestamp (or date)
+    column rather than text that has to be cast.
+    """
+    from sqlalchemy import text
+    data_type = connection.execute(text("""
+        SELECT data_type
+        FROM information_schema.columns
+        WHERE table_name = 'helius_addresses' AND column_name = 'last_updated'
+          AND table_schema = ANY (current_schemas(false))
+        LIMIT 1
+    """)).scalar()
+    return data_type in TIMESTAMP_TYPES
 
 def fetch_addresses_from_db():
     """
-    Connect to the database and retrieve distinct addresses.
+    Connect to the database and retrieve distinct addresses updated within
+    the last HELIUS_ADDRESS_MAX_AGE_DAYS days (default 30).
     Returns a list of addresses.
     """
-    # Force reload from .env file
-    load_dotenv(override=True)
-    database_url = os.getenv("DATABASE_URL")
-    
-    logging.info("Fetching addresses from DB using URL: %s", database_url)
-    if not database_url:
-        logging.error("DATABASE_URL is not set.")
+    logging.info("Fetching addresses from DB")
+    engine = get_engine()
+    if engine is None:
         return []
-    engine = create_engine(database_url)
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
     try:
-        with engine.connect() as connection:
+        with connect(engine) as connection:
+            if last_updated_is_timestamp(connection):
+                # Compared as is, so the (last_updated, address) index can
+                # answer the query without touching the table.
+                last_updated = "last_updated"
+            else:
+                # Stored as text: cast it like the original query did.
+                last_updated = "CAST(last_updated AS TIMESTAMP)"
             result = connection.execute(
-                text("""
-SELECT *
+                text(f"""
+SELECT DISTINCT address
 FROM helius_addresses
-WHERE CAST(last_updated AS TIMESTAMP) >= (CURRENT_TIMESTAMP - INTERVAL '30 days')
-                     """)
-            ).mappings()
-            addresses = [row["address"] for row in result if row["address"]]
+WHERE {last_updated} >= CURRENT_TIMESTAMP - make_interval(days => :max_age_days)
+  AND address IS NOT NULL AND address <> ''
+                     """),
+                {"max_age_days": get_config().address_max_age_days},
+            )
+            addresses = [row[0] for row in result]
             logging.info("Fetched addresses from DB: %s", len(addresses))
             return addresses
     except SQLAlchemyError as e:
         logging.error("Error fetching addresses: %s", e)
         return []
 
+def ensure_address_index():
+    """
+    Creates the covering index used by fetch_addresses_from_db if missing.
+    Skipped when helius_addresses.last_updated is not a timestamp column,
+    because the cast query could not use it.
+    """
+    engine = get_engine()
+    if engine is None:
+        return
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
+    try:
+        with begin(engine) as connection:
+            if not last_updated_is_timestamp(connection):
+                logging.info("helius_addresses.last_updated is not a timestamp; "
+                             "skipping the (last_updated, address) index.")
+                return
+            connection.execute(text("""
+                CREATE INDEX IF NOT EXISTS helius_addresses_last_updated_idx
+                ON helius_addresses (last_updated, address)
+            """))
+    except SQLAlchemyError as e:
+        logging.error("Error creating helius_addresses index: %s", e)
+
+# Whether helius_hook has the plain unique index on payload_hash that
+# ON CONFLICT (payload_hash) needs. False when the table does not exist.
+DEDUP_INDEX_QUERY = """
+    SELECT EXISTS (
+        SELECT 1
+        FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = to_regclass('helius_hook')
+          AND i.indisunique AND i.indnatts = 1 AND i.indpred IS NULL
+          AND a.attname = 'payload_hash'
+    )
+"""
+
+DEDUP_SCHEMA_ERROR = ("WEBHOOK_DEDUP is enabled but helius_hook has no unique index on "
+                      "payload_hash. Run process_hooks.py (or the SQL in the README) "
+                      "to create it.")
+
+def has_dedup_index():
+    """
+    Returns whether helius_hook has the payload_hash unique index, or None
+    when the database is not configured or cannot be reached.
+    """
+    engine = get_engine()
+    if engine is None:
+        return None
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
+    try:
+        with connect(engine) as connection:
+            return bool(connection.execute(text(DEDUP_INDEX_QUERY)).scalar())
+    except SQLAlchemyError as e:
+        logging.error("Error checking the helius_hook payload_hash index: %s", e)
+        return None
+
+@timed("insert")
 def insert_raw_payload(payload):
     """
     Inserts the raw JSON payload into the helius_hook table.
@@ -59,13 +170,13 @@ def insert_raw_payload(payload):
       - received_at (timestamp)
       - processed (boolean)
     """
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        logging.error("DATABASE_URL is not set.")
+    engine = get_engine()
+    if engine is None:
         return None
-    engine = create_engine(database_url)
+    from sqlalchemy import text
+    from sqlalchemy.exc import SQLAlchemyError
     try:
-        with engine.begin() as connection:
+        with begin(engine) as connection:
             query = text("""
                 INSERT INTO helius_hook (payload, received_at, processed)
                 VALUES (:payload, :received_at, false)
@@ -76,8 +187,132 @@ def insert_raw_payload(payload):
                 "received_at": datetime.utcnow()
             })
             inserted_id = result.fetchone()[0]
-            logging.info("Inserted raw payload with id %s", inserted_id)
+            request_log.info("Inserted raw payload with id %s", inserted_id)
             return inserted_id
     except SQLAlchemyError as e:
+        count_error("insert")
         logging.error("Error inserting raw payload: %s", e)
         return None
+
+def insert_raw_row(row):
+    """
+    Inserts a prebuilt helius_hook row (see payload_codec.build_raw_row), so
+    the request body is stored without being parsed and re-serialized.
+    Compressed rows need the extra columns:
+      - payload_raw (bytea)
+      - payload_encoding (text)
+    Rows with a 'payload_hash' need a unique index on that column (bytea).
+    Returns the inserted id, DUPLICATE if the payload_hash already exists,
+    or None on error.
+    """
+    inserted_ids = insert_raw_payloads([row])
+    return inserted_ids[0] if inserted_ids else None
+
+@timed("insert")
+def insert_raw_payloads(rows):
+    """
+    Inserts a batch of raw payload rows into the helius_hook table with a
+    single multi-row INSERT ... RETURNING id.
+    Each row is a dict with 'payload' (serialized JSON text) and 'received_at',
+    plus 'payload_raw' and 'payload_encoding' for compressed payloads and
+    'payload_hash' for deduplicated ones.
+    Returns the list of inserted ids in the same order as rows (DUPLICATE for
+    rows whose payload_hash already exists), or None on error.
+    """
+    if not rows:
+        return []
+    engine = get_engine()
+    if engine is None:
+        return None
+    from sqlalchemy.dialects.postgresql import insert
+    from sqlalchemy.exc import SQLAlchemyError
+    helius_hook = hook_table()
+    columns = _row_columns(rows)
+    values = [
+        dict({name: row.get(name) for name in columns}, processed=False)
+        for row in rows
+    ]
+    try:
+        with begin(engine) as connection:
+            query = insert(helius_hook).values(values)
+            if "payload_hash" in columns:
+                query = query.on_conflict_do_nothing(index_elements=["payload_hash"]).returning(
+                    helius_hook.c.id, helius_hook.c.payload_hash
+                )
+                ids_by_hash = {bytes(payload_hash): inserted_id
+                               for inserted_id, payload_hash in connection.execute(query)}
+                inserted_ids = [ids_by_hash.pop(row.get("payload_hash"), DUPLICATE) for row in rows]
+            else:
+                query = query.returning(helius_hook.c.id)
+                inserted_ids = [row[0] for row in connection.execute(query)]
+        new_ids = [inserted_id for inserted_id in inserted_ids if inserted_id is not DUPLICATE]
+        if len(new_ids) < len(inserted_ids):
+            request_log.info("Skipped %s duplicate raw payloads", len(inserted_ids) - len(new_ids))
+        if len(new_ids) == 1:
+            request_log.info("Inserted raw payload with id %s", new_ids[0])
+        elif new_ids:
+            request_log.info("Inserted %s raw payloads (ids %s-%s)",
+                             len(new_ids), new_ids[0], new_ids[-1])
+        return inserted_ids
+    except SQLAlchemyError as e:
+        count_error("insert")
+        logging.error("Error inserting raw payload batch: %s", e)
+        return None
+
+def copy_raw_payloads(rows):
+    """
+    Loads a batch of raw payload rows into the helius_hook table with
+    Postgres COPY. Faster than INSERT for large batches but does not return ids.
+    COPY cannot skip conflicts, so deduplicated rows (with 'payload_hash') are
+    written with insert_raw_payloads instead.
+    Returns the number of rows written, or None on error.
+    """
+    if not rows:
+        return 0
+    engine = get_engine()
+    if engine is None:
+        return None
+    columns = _row_columns(rows)
+    if "payload_hash" in columns:
+        inserted_ids = insert_raw_payloads(rows)
+        if inserted_ids is None:
+            return None
+        return sum(1 for inserted_id in inserted_ids if inserted_id is not DUPLICATE)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        record = []
+        for name in columns:
+            value = row.get(name)
+            if name == "received_at":
+                value = value.isoformat()
+            elif name == "payload_raw" and value is not None:
+                value = "\\x" + value.hex()
+            record.append(value)
+        writer.writerow(record + ["f"])
+    buffer.seek(0)
+    start = time.perf_counter()
+    raw_connection = None
+    try:
+        raw_connection = engine.raw_connection()
+        with raw_connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY helius_hook ({', '.join(columns)}, processed) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        raw_connection.commit()
+        request_log.info("Copied %s raw payloads", len(rows))
+        return len(rows)
+    except Exception as e:
+        count_error("insert")
+        logging.error("Error copying raw payload batch: %s", e)
+        if raw_connection is not None:
+            try:
+                raw_connection.rollback()
+            except Exception as rollback_error:
+                logging.error("Error rolling back raw payload copy: %s", rollback_error)
+        return None
+    finally:
+        if raw_connection is not None:
+            raw_connection.close()
+        observe("insert", time.perf_counter() - start)
@@ -0,0 +1,126 @@
+# dedup.py
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from settings import get_config
+from metrics import record_dedup_lookup, record_dedup_cache
+
+# Matches the top-level "signature" of each enhanced transaction in the raw
+# body, so the key can be computed without parsing the payload.
+_SIGNATURE_RE = re.compile(rb'"signature"\s*:\s*"([1-9A-HJ-NP-Za-km-z]{32,100})"')
+
+# 128-bit keys: small enough to keep many in memory, with negligible collisions.
+KEY_BYTES = 16
+
+
+def dedup_enabled():
+    return get_config().dedup
+
+
+def payload_key(body):
+    """
+    Returns the dedup key for a raw webhook body: a hash of its sorted
+    transaction signatures, or of the whole body when it has none. Replays of
+    the same transactions get the same key even if Helius re-serializes them.
+    """
+    signatures = _SIGNATURE_RE.findall(body)
+    if signatures:
+        material = b"sig:" + b"\n".join(sorted(set(signatures)))
+    else:
+        material = b"body:" + body
+    return hashlib.blake2b(material, digest_size=KEY_BYTES).digest()
+
+
+class DedupCache:
+    """
+    Bounded LRU cache of recently seen payload keys with a TTL.
+
+    Holds at most max_entries keys (roughly 200 bytes each); the least
+    recently seen key is evicted first. It only short-circuits repeats. The
+    unique index on helius_hook.payload_hash is the source of truth.
+    Lookups, evictions and the size are exported as webhook_dedup_cache_*
+    metrics; stats() returns the same numbers for this process.
+    """
+
+    def __init__(self, max_entries=100000, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db_duplicates = 0
+
+    def seen(self, key):
+        """
+        Returns True (a hit) if key was added within the TTL.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expires = self._entries.get(key)
+            hit = expires is not None and expires > now
+            if hit:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                if expires is not None:
+                    del self._entries[key]
+            size = len(self._entries)
+        record_dedup_lookup(hit)
+        if expires is not None and not hit:
+            record_dedup_cache(size)
+        return hit
+
+    def add(self, key):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+            size = len(self._entries)
+        record_dedup_cache(size, evicted)
+
+    def record_db_duplicate(self, key):
+        """
+        Records a duplicate that got past the cache and was caught by the
+        unique index, and caches its key.
+        """
+        with self._lock:
+            self.db_duplicates += 1
+        self.add(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "db_duplicates": self.db_duplicates,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """
+    Returns the process-wide DedupCache, sized by DEDUP_CACHE_SIZE
+    (default 100000 keys) and DEDUP_TTL (default 3600 seconds).
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = get_config()
+                _cache = DedupCache(max_entries=config.dedup_cache_size, ttl=config.dedup_ttl)
+    return _cache
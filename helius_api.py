@@ -1,71 +1,316 @@
 # helius_api.py
 import os
+import json
+import hashlib
 import logging
-from helius import WebhooksAPI
-from db_helpers import fetch_addresses_from_db
+import threading
+from settings import get_config
+from db_helpers import fetch_addresses_from_db, ensure_address_index
+from metrics import timed, count_error
 
-def update_or_create_webhook(new_url):
+def webhook_settings(new_url):
+    """
+    Returns the webhook definition shared by every shard, from the Config.
+    """
+    config = get_config()
+    return {
+        "webhook_url": new_url,
+        "transaction_types": list(config.helius_transaction_types),
+        "webhook_type": config.helius_webhook_type,
+        "auth_header": config.helius_auth_header,
+        # The webhook this deployment owns (HELIUS_WEBHOOK_ID in .env).
+        "webhook_id": config.helius_webhook_id,
+    }
+
+def definition_fingerprint(settings):
+    """
+    Hash of the webhook definition (URL, types, auth header, owned webhook
+    id), so the cache can tell when every webhook must be edited without
+    storing the header.
+    """
+    return hashlib.sha256(json.dumps(
+        [settings["webhook_url"], sorted(settings["transaction_types"]),
+         settings["webhook_type"], settings["auth_header"], settings["webhook_id"]]
+    ).encode()).hexdigest()
+
+def compute_etag(addresses, settings):
+    """
+    Fingerprint of the desired state: the address set plus the webhook
+    definition. If it matches the cached etag there is nothing to sync.
+    """
+    digest = hashlib.sha256(definition_fingerprint(settings).encode())
+    for address in sorted(addresses):
+        digest.update(address.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+def load_cache(path):
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning("Ignoring unreadable webhook cache %s: %s", path, e)
+        return None
+
+def save_cache(path, cache):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as handle:
+        json.dump(cache, handle)
+    os.replace(tmp_path, path)
+
+def fetch_registered_shards(webhooks_api, managed_ids, webhook_url):
+    """
+    Returns {webhook_id: set(addresses)} for the registered webhooks this
+    sync manages: those in managed_ids and those already pointing at
+    webhook_url. Other webhooks on the Helius account are left alone.
+    """
+    shards = {}
+    for webhook in webhooks_api.get_all_webhooks() or []:
+        webhook_id = webhook.get("webhookID")
+        if not webhook_id:
+            logging.error("Existing webhook found but no webhookID; ignoring it.")
+            continue
+        if webhook_id in managed_ids or webhook.get("webhookURL") == webhook_url:
+            shards[webhook_id] = set(webhook.get("accountAddresses") or [])
+    return shards
+
+def adopt_existing_webhook(webhooks_api, webhook_url):
+    """
+    Picks the webhook to manage when HELIUS_WEBHOOK_ID is not set and no
+    webhook is on record, as the original single-webhook sync did: the only
+    webhook on the account. Returns its id, or None if the account has no
+    webhooks or some already point at webhook_url. Raises ValueError if there
+    are several, since the sync cannot tell which one is ours.
+    """
+    webhooks = [webhook for webhook in webhooks_api.get_all_webhooks() or []
+                if webhook.get("webhookID")]
+    if not webhooks or any(webhook.get("webhookURL") == webhook_url for webhook in webhooks):
+        return None
+    if len(webhooks) > 1:
+        raise ValueError(f"{len(webhooks)} webhooks exist on the Helius account; set "
+                         "HELIUS_WEBHOOK_ID to the one this deployment owns.")
+    webhook_id = webhooks[0]["webhookID"]
+    logging.info("HELIUS_WEBHOOK_ID is not set; adopting the existing webhook %s.", webhook_id)
+    return webhook_id
+
+def resolve_cache_path(path):
+    """
+    Resolves a relative HELIUS_WEBHOOK_CACHE against this module's directory,
+    so the cache does not depend on the working directory.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+def plan_shards(current, desired, max_per_webhook, deletable=()):
+    """
+    Distributes the desired addresses across the managed webhooks in
+    current, keeping every address that is still wanted on the webhook it is
+    already registered with.
+
+    A webhook that cannot be deleted is not left empty while a deletable one
+    has addresses: the smallest deletable shard is moved onto it.
+
+    Returns (shards, new_shards, empty_ids): the updated assignment for the
+    existing webhook ids, lists of addresses for webhooks to create, and ids
+    of webhooks left with no addresses. Only ids in deletable (the webhooks
+    the sync created) are ever returned in empty_ids; a webhook that cannot
+    be deleted may still end up empty and must be cleared.
+    """
+    shards = {}
+    assigned = set()
+    for webhook_id, addresses in current.items():
+        kept = set(sorted(addresses & (desired - assigned))[:max_per_webhook])
+        shards[webhook_id] = kept
+        assigned |= kept
+
+    additions = sorted(desired - assigned)
+    for webhook_id, addresses in shards.items():
+        room = max_per_webhook - len(addresses)
+        if room > 0 and additions:
+            addresses.update(additions[:room])
+            additions = additions[room:]
+
+    for webhook_id, addresses in shards.items():
+        if addresses or webhook_id in deletable:
+            continue
+        donors = [donor_id for donor_id, donor in shards.items()
+                  if donor and donor_id in deletable]
+        if donors:
+            donor_id = min(donors, key=lambda donor_id: (len(shards[donor_id]), donor_id))
+            addresses.update(shards[donor_id])
+            shards[donor_id] = set()
+
+    new_shards = [additions[i:i + max_per_webhook]
+                  for i in range(0, len(additions), max_per_webhook)]
+    empty_ids = [webhook_id for webhook_id, addresses in shards.items()
+                 if not addresses and webhook_id in deletable]
+    return shards, new_shards, empty_ids
+
+@timed("helius_sync")
+def sync_addresses(new_url, webhooks_api=None, cache_path=None, force=False):
     """
-    Uses the Helius SDK to update existing webhooks or create a new one.
+    Brings the Helius webhooks in line with the addresses in the database.
+
+    Only managed webhooks are touched: HELIUS_WEBHOOK_ID, the shards this
+    sync created (recorded in the cache), and webhooks already pointing at
+    new_url. Only shards the sync created are ever deleted. Without
+    HELIUS_WEBHOOK_ID, the only webhook on the account is adopted in its place
+    (see adopt_existing_webhook).
+
+    The registered state is cached locally (HELIUS_WEBHOOK_CACHE) with a
+    version and an etag of the desired state, so an unchanged address set
+    costs one DB query and no Helius calls. Otherwise only webhooks whose
+    address list changed are edited. Addresses are sharded across webhooks of
+    at most HELIUS_MAX_ADDRESSES_PER_WEBHOOK addresses, and existing
+    addresses stay on the webhook they are already on.
+    Returns True if the webhooks are in sync.
     """
-    api_key = os.getenv("HELIUS_API_KEY")
+    config = get_config()
+    api_key = config.helius_api_key
     if not api_key:
         logging.error("HELIUS_API_KEY is not set.")
-        return
-
-    # Initialize the Helius SDK
-    webhooks_api = WebhooksAPI(api_key)
-    
-    # Get configuration from environment variables
-    transaction_types_env = os.getenv("HELIUS_TRANSACTION_TYPES", "SWAP")
-    transaction_types = [x.strip() for x in transaction_types_env.split(",")]
-    webhook_type = os.getenv("HELIUS_WEBHOOK_TYPE", "enhanced")
-    auth_header = os.getenv("HELIUS_AUTH_HEADER", "")
-    
+        return False
+    if webhooks_api is None:
+        # Imported here so that importing this module stays cheap.
+        from helius import WebhooksAPI
+        webhooks_api = WebhooksAPI(api_key)
+    cache_path = resolve_cache_path(cache_path or config.helius_webhook_cache)
+    max_per_webhook = config.helius_max_addresses_per_webhook
+    settings = webhook_settings(new_url)
+
     # Get addresses from the database
-    addresses = fetch_addresses_from_db()
-    if not addresses:
+    desired = set(fetch_addresses_from_db())
+    if not desired:
         logging.error("No addresses retrieved from the DB. Exiting.")
-        return
-    
+        return False
+
+    cache = load_cache(cache_path) or {}
+    # Shards created by earlier syncs stay managed (and deletable) even when
+    # the rest of the cache is stale; so does an adopted webhook.
+    created = set(cache.get("created", []))
+    adopted = cache.get("adopted")
+    if not settings["webhook_id"]:
+        settings["webhook_id"] = adopted
+    if force:
+        cache = {"version": cache.get("version"), "created": sorted(created), "adopted": adopted}
+    etag = compute_etag(desired, settings)
+    if cache.get("etag") == etag:
+        logging.info("Helius webhooks already up to date (version %s, %s addresses).",
+                     cache.get("version"), len(desired))
+        return True
+
+    version = (cache.get("version") or 0) + 1
     try:
-        # Get existing webhooks
-        existing_webhooks = webhooks_api.get_all_webhooks()
-        
-        if existing_webhooks and len(existing_webhooks) > 0:
-            # If webhooks exist, update the first one
-            webhook_id = existing_webhooks[0].get("webhookID")
-            if webhook_id:
-                logging.info("Updating existing webhook with ID: %s", webhook_id)
-                result = webhooks_api.edit_webhook(
-                    webhook_id,
-                    new_url,
-                    transaction_types,
-                    addresses,
-                    webhook_type,
-                    auth_header
-                )
-                logging.info("Webhook update result: %s", result)
-            else:
-                logging.error("Existing webhook found but no webhookID; creating a new webhook.")
-                result = webhooks_api.create_webhook(
-                    new_url,
-                    transaction_types,
-                    addresses,
-                    webhook_type,
-                    auth_header
-                )
-                logging.info("Webhook creation result: %s", result)
+        if not settings["webhook_id"] and not created:
+            adopted = adopt_existing_webhook(webhooks_api, settings["webhook_url"])
+            if adopted:
+                settings["webhook_id"] = adopted
+                etag = compute_etag(desired, settings)
+        primary_id = settings["webhook_id"]
+        managed_ids = created | ({primary_id} if primary_id else set())
+        definition = definition_fingerprint(settings)
+        if cache.get("definition") == definition:
+            current = {webhook_id: set(addresses)
+                       for webhook_id, addresses in cache.get("shards", {}).items()}
         else:
-            # If no webhooks exist, create a new one
-            logging.info("No existing webhook found; creating a new webhook.")
+            current = fetch_registered_shards(webhooks_api, managed_ids, settings["webhook_url"])
+        shards, new_shards, empty_ids = plan_shards(current, desired, max_per_webhook,
+                                                    deletable=created - {primary_id})
+
+        definition_changed = cache.get("definition") != definition
+        for webhook_id, addresses in shards.items():
+            if webhook_id in empty_ids:
+                continue
+            # A webhook that cannot be deleted is cleared rather than left
+            # monitoring addresses that are no longer wanted.
+            added = addresses - current.get(webhook_id, set())
+            removed = current.get(webhook_id, set()) - addresses
+            if not added and not removed and not definition_changed:
+                continue
+            logging.info("Updating webhook %s: +%s / -%s addresses (%s total)",
+                         webhook_id, len(added), len(removed), len(addresses))
+            webhooks_api.edit_webhook(
+                webhook_id,
+                settings["webhook_url"],
+                settings["transaction_types"],
+                sorted(addresses),
+                settings["webhook_type"],
+                settings["auth_header"]
+            )
+        for webhook_id in empty_ids:
+            logging.info("Deleting webhook %s: no addresses left.", webhook_id)
+            webhooks_api.delete_webhook(webhook_id)
+            del shards[webhook_id]
+            created.discard(webhook_id)
+        for addresses in new_shards:
+            logging.info("Creating webhook for %s addresses.", len(addresses))
             result = webhooks_api.create_webhook(
-                new_url,
-                transaction_types,
+                settings["webhook_url"],
+                settings["transaction_types"],
                 addresses,
-                webhook_type,
-                auth_header
+                settings["webhook_type"],
+                settings["auth_header"]
             )
-            logging.info("Webhook creation result: %s", result)
+            webhook_id = (result or {}).get("webhookID")
+            if not webhook_id:
+                raise ValueError(f"Webhook creation returned no webhookID: {result}")
+            shards[webhook_id] = set(addresses)
+            created.add(webhook_id)
     except Exception as e:
-        logging.error("Exception while managing webhook: %s", e)
\ No newline at end of file
+        count_error("helius_sync")
+        logging.error("Exception while managing webhook: %s", e)
+        # Part of the plan may have been applied; re-read the registered
+        # state from Helius on the next sync, but remember what we created.
+        try:
+            save_cache(cache_path, {"version": version, "created": sorted(created),
+                                    "adopted": adopted})
+        except OSError as cache_error:
+            logging.warning("Could not write webhook cache %s: %s", cache_path, cache_error)
+        return False
+
+    try:
+        save_cache(cache_path, {
+            "version": version,
+            "etag": etag,
+            "definition": definition,
+            "created": sorted(created),
+            "adopted": adopted,
+            "shards": {webhook_id: sorted(addresses) for webhook_id, addresses in shards.items()},
+        })
+    except OSError as e:
+        logging.warning("Could not write webhook cache %s: %s", cache_path, e)
+    logging.info("Helius webhooks synced (version %s): %s addresses across %s webhook(s).",
+                 version, len(desired), len(shards))
+    return True
+
+def update_or_create_webhook(new_url):
+    """
+    Uses the Helius SDK to update existing webhooks or create new ones so
+    that they cover every address in the database.
+    """
+    ensure_address_index()
+    sync_addresses(new_url)
+
+def start_periodic_sync(new_url, interval=None):
+    """
+    Runs sync_addresses in a daemon thread, immediately and then every
+    interval seconds (HELIUS_SYNC_INTERVAL, default 300). Returns an Event
+    that stops the loop when set.
+    """
+    if interval is None:
+        interval = get_config().helius_sync_interval
+    stop = threading.Event()
+
+    def run():
+        ensure_address_index()
+        while True:
+            try:
+                sync_addresses(new_url)
+            except Exception as e:
+                logging.error("Exception while syncing webhook addresses: %s", e)
+            if stop.wait(interval):
+                return
+
+    threading.Thread(target=run, name="helius-address-sync", daemon=True).start()
+    return stop
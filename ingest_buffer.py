@@ -0,0 +1,213 @@
+# ingest_buffer.py
+import json
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from settings import get_config
+from db_helpers import DUPLICATE, insert_raw_payloads, copy_raw_payloads
+
+# Marker placed on the queue to wake the flusher during shutdown.
+_STOP = object()
+
+
+class BufferFull(Exception):
+    """
+    Raised by BufferedWriter.submit() when the queue is at capacity.
+    """
+
+
+class BufferedWriter:
+    """
+    Write-behind buffer for webhook payloads.
+
+    Accepted payloads go into a bounded in-memory queue; a background thread
+    writes them to helius_hook in batches, flushing whenever batch_size rows
+    are pending or flush_interval seconds have passed since the first one.
+
+    method is "insert" (multi-row INSERT ... RETURNING id) or "copy"
+    (Postgres COPY, no ids). COPY cannot skip conflicts, so in copy mode
+    batches with dedup keys are inserted instead. on_commit(ids, count) is
+    called from the flusher thread after every batch that stored new rows;
+    ids is None for copied batches and never includes duplicates.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=0.5,
+                 method="insert", on_commit=None):
+        if method not in ("insert", "copy"):
+            raise ValueError(f"Unknown buffer method: {method}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.method = method
+        self.on_commit = on_commit
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+        self._thread.start()
+        logging.info("Started buffered writer (method=%s, batch_size=%s, flush_interval=%ss)",
+                     self.method, self.batch_size, self.flush_interval)
+
+    def submit(self, payload):
+        """
+        Queues a payload for writing and returns a Future that resolves to the
+        inserted id (None for a copied row, db_helpers.DUPLICATE for an already
+        stored payload) once its batch commits. Cancelling the Future before
+        the flusher picks it up drops the payload.
+        Raises BufferFull if the queue is at capacity, or RuntimeError if the
+        writer is shutting down.
+        """
+        return self.submit_row({"payload": json.dumps(payload), "received_at": datetime.utcnow()})
+
+    def submit_row(self, row):
+        """
+        Like submit(), but takes a prebuilt helius_hook row such as the one
+        from payload_codec.build_raw_row.
+        """
+        if self._stopping.is_set():
+            raise RuntimeError("Buffered writer is shutting down.")
+        if self._thread is None or not self._thread.is_alive():
+            # Nothing would ever write the row or resolve its Future.
+            raise RuntimeError("Buffered writer is not running.")
+        future = Future()
+        try:
+            self._queue.put_nowait((row, future))
+        except queue.Full:
+            raise BufferFull()
+        return future
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stop(self, timeout=30):
+        """
+        Stops accepting payloads, flushes everything already queued and waits
+        for the flusher thread to exit.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logging.error("Buffered writer queue stayed full during shutdown.")
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.error("Buffered writer did not drain within %ss; %s payloads pending.",
+                          timeout, self._queue.qsize())
+        else:
+            logging.info("Buffered writer drained and stopped.")
+        self._thread = None
+
+    def _run(self):
+        stop = False
+        while not stop:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+        # Drain whatever was queued before the stop marker.
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                continue
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        self._flush(batch)
+
+    def _flush(self, batch):
+        # Skip rows whose caller gave up waiting and cancelled them.
+        batch = [(row, future) for row, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            self._write(batch)
+        except Exception as e:
+            # Fail this batch, not the flusher thread.
+            logging.error("Exception writing batch of %s payloads: %s", len(batch), e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def _write(self, batch):
+        rows = [row for row, _ in batch]
+        futures = [future for _, future in batch]
+        copied = self.method == "copy" and not any(row.get("payload_hash") for row in rows)
+        if copied:
+            count = copy_raw_payloads(rows)
+            ids = None if count is None else [None] * len(rows)
+        else:
+            ids = insert_raw_payloads(rows)
+            count = None if ids is None else sum(1 for i in ids if i is not DUPLICATE)
+
+        if ids is None:
+            logging.error("Failed to write batch of %s payloads.", len(batch))
+            error = RuntimeError("Failed to write raw payload batch")
+            for future in futures:
+                future.set_exception(error)
+            return
+
+        for future, inserted_id in zip(futures, ids):
+            future.set_result(inserted_id)
+        if self.on_commit is not None and count:
+            new_ids = None if copied else [i for i in ids if i is not DUPLICATE]
+            try:
+                self.on_commit(new_ids, count)
+            except Exception as e:
+                logging.error("Exception in buffered writer commit callback: %s", e)
+
+
+def writer_from_env(on_commit=None):
+    """
+    Builds a BufferedWriter from the WEBHOOK_BUFFER_* environment variables:
+      - WEBHOOK_BUFFER_MAX_QUEUE (default 10000)
+      - WEBHOOK_BUFFER_BATCH_SIZE (default 500)
+      - WEBHOOK_BUFFER_FLUSH_INTERVAL (default 0.5 seconds)
+      - WEBHOOK_BUFFER_METHOD (default "insert"; or "copy")
+    """
+    config = get_config()
+    return BufferedWriter(
+        max_queue=config.buffer_max_queue,
+        batch_size=config.buffer_batch_size,
+        flush_interval=config.buffer_flush_interval,
+        method=config.buffer_method,
+        on_commit=on_commit,
+    )
+
+
+def buffering_enabled():
+    return get_config().buffered
+
+
+def durable_acks():
+    return get_config().buffer_durable
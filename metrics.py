@@ -0,0 +1,219 @@
+# metrics.py
+import os
+import hmac
+import time
+import cProfile
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager, ContextDecorator
+
+# Pipeline stages timed by webhook_stage_seconds.
+STAGES = ("parse", "insert", "pool_wait", "dag_trigger", "helius_sync")
+
+# From sub-millisecond parses and pool checkouts up to slow Helius syncs.
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_declared = []
+_metrics_lock = threading.Lock()
+_profile_lock = threading.Lock()
+
+
+class LazyMetric:
+    """
+    A prometheus_client metric that is created on first use. Importing
+    prometheus_client takes tens of milliseconds (its package imports the
+    exposition code and http.server), so library modules declare metrics
+    without paying for it at import time. Attribute access is forwarded to
+    the real metric.
+    """
+
+    def __init__(self, kind, name, documentation, labelnames=(), **kwargs):
+        self._kind = kind
+        self._args = (name, documentation, labelnames)
+        self._kwargs = kwargs
+        self._metric = None
+        _declared.append(self)
+
+    def resolve(self):
+        metric = self._metric
+        if metric is None:
+            with _metrics_lock:
+                if self._metric is None:
+                    import prometheus_client
+                    factory = getattr(prometheus_client, self._kind)
+                    self._metric = factory(*self._args, **self._kwargs)
+                metric = self._metric
+        return metric
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+STAGE_SECONDS = LazyMetric(
+    "Histogram", "webhook_stage_seconds", "Time spent in each stage of the webhook pipeline",
+    ["stage"], buckets=STAGE_BUCKETS,
+)
+REQUESTS = LazyMetric("Counter", "webhook_requests", "Webhook deliveries by HTTP status",
+                      ["status"])
+ERRORS = LazyMetric("Counter", "webhook_errors", "Errors by pipeline stage", ["stage"])
+PAYLOAD_BYTES = LazyMetric("Counter", "webhook_payload_bytes", "Bytes of webhook payload received")
+PAYLOAD_TRANSACTIONS = LazyMetric(
+    "Histogram", "webhook_payload_transactions", "Transactions per webhook payload",
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+DUPLICATES = LazyMetric("Counter", "webhook_duplicates",
+                        "Duplicate deliveries by where they were caught", ["source"])
+DEDUP_LOOKUPS = LazyMetric("Counter", "webhook_dedup_cache_lookups",
+                           "Dedup cache lookups by result (hit or miss)", ["result"])
+DEDUP_EVICTIONS = LazyMetric("Counter", "webhook_dedup_cache_evictions",
+                             "Keys evicted from the dedup cache to stay within DEDUP_CACHE_SIZE")
+DEDUP_CACHE_SIZE = LazyMetric("Gauge", "webhook_dedup_cache_size", "Keys held in the dedup cache",
+                              multiprocess_mode="livesum")
+DAG_TRIGGER_REQUESTS = LazyMetric("Counter", "dag_trigger_requests",
+                                  "DAG run requests submitted by the listener")
+DAG_TRIGGERS = LazyMetric("Counter", "dag_triggers", "DAG trigger attempts by outcome",
+                          ["result"])
+DAG_TRIGGER_COALESCED = LazyMetric(
+    "Counter", "dag_trigger_coalesced",
+    "DAG run requests folded into a run started by another request",
+)
+
+# Labelled children are resolved once per stage, so the hot path skips labels().
+_stage_timers = {}
+_errors = {}
+_dedup_lookups = {}
+
+
+def _child(children, metric, stage):
+    child = children.get(stage)
+    if child is None:
+        if stage not in STAGES:
+            raise KeyError(stage)
+        child = children[stage] = metric.labels(stage)
+    return child
+
+
+class _StageTimer(ContextDecorator):
+    def __init__(self, stage):
+        self.stage = stage
+
+    def _recreate_cm(self):
+        # Each decorated call gets its own timer, so threads do not share _start.
+        return _StageTimer(self.stage)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.stage, time.perf_counter() - self._start)
+
+
+def timed(stage):
+    """
+    Returns a context manager (also usable as a decorator) that records the
+    duration of the block in webhook_stage_seconds{stage=...}.
+    """
+    if stage not in STAGES:
+        raise KeyError(stage)
+    return _StageTimer(stage)
+
+
+def observe(stage, seconds):
+    _child(_stage_timers, STAGE_SECONDS, stage).observe(seconds)
+
+
+def count_error(stage):
+    _child(_errors, ERRORS, stage).inc()
+
+
+def record_dedup_lookup(hit):
+    result = "hit" if hit else "miss"
+    child = _dedup_lookups.get(result)
+    if child is None:
+        child = _dedup_lookups[result] = DEDUP_LOOKUPS.labels(result)
+    child.inc()
+
+
+def record_dedup_cache(size, evicted=0):
+    DEDUP_CACHE_SIZE.set(size)
+    if evicted:
+        DEDUP_EVICTIONS.inc(evicted)
+
+
+def count_request(status):
+    REQUESTS.labels(str(status)).inc()
+
+
+def record_payload(body):
+    """
+    Counts the bytes of a raw webhook body and its transactions. Transactions
+    are counted from their top-level "signature" keys, so the body does not
+    need to be parsed.
+    """
+    PAYLOAD_BYTES.inc(len(body))
+    PAYLOAD_TRANSACTIONS.observe(body.count(b'"signature"'))
+
+
+def metrics_status(config, authorization):
+    """
+    Returns the HTTP status for a GET /metrics request: 404 unless
+    WEBHOOK_METRICS is on (the webhook port is public through the tunnel),
+    401 if WEBHOOK_METRICS_TOKEN is set and the Authorization header is not
+    "Bearer <token>", otherwise 200.
+    """
+    if not config.metrics_enabled:
+        return 404
+    if config.metrics_token and not hmac.compare_digest(
+            (authorization or "").encode(), f"Bearer {config.metrics_token}".encode()):
+        return 401
+    return 200
+
+
+def render_metrics():
+    """
+    Returns (body, content_type) in the Prometheus text format. With
+    PROMETHEUS_MULTIPROC_DIR set, metrics of every worker process are merged.
+    """
+    # Metrics nothing has used yet are created now, so they are exported as zero.
+    for metric in _declared:
+        metric.resolve()
+    from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+    from prometheus_client import multiprocess
+
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+@contextmanager
+def profile_request(name, profile_dir=None):
+    """
+    Runs the block under cProfile and dumps the stats to
+    <profile_dir>/<name>-<pid>-<time>.prof (view with snakeviz or pstats).
+    Only one request is profiled at a time; concurrent ones run unprofiled.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+        profile_dir = profile_dir or tempfile.gettempdir()
+        path = os.path.join(profile_dir, f"{name}-{os.getpid()}-{time.time():.6f}.prof")
+        try:
+            profiler.dump_stats(path)
+            logging.info("Wrote request profile to %s", path)
+        except OSError as e:
+            logging.error("Could not write request profile %s: %s", path, e)
+    finally:
+        _profile_lock.release()
@@ -0,0 +1,123 @@
+# payload_codec.py
+import gzip
+import json
+import logging
+from datetime import datetime
+from functools import lru_cache
+from settings import get_config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+_WHITESPACE = b" \t\r\n"
+
+
+def raw_body_enabled():
+    return get_config().raw_body
+
+
+def strict_validation():
+    return get_config().validate_strict
+
+
+def validate_body(body, strict=False):
+    """
+    Checks that body (bytes) looks like a JSON object or array and raises
+    ValueError if not.
+
+    The default check only looks at the first and last non-whitespace bytes,
+    which is enough to reject non-JSON deliveries without parsing. With
+    strict=True the body is fully parsed (with orjson when installed).
+    """
+    stripped = body.strip(_WHITESPACE)
+    if not stripped:
+        raise ValueError("Empty payload")
+    if (stripped[:1], stripped[-1:]) not in ((b"[", b"]"), (b"{", b"}")):
+        raise ValueError("Payload is not a JSON object or array")
+    if strict:
+        loads(body)
+
+
+def compression_from_env():
+    return _effective_compression(get_config().payload_compression)
+
+
+@lru_cache(maxsize=None)
+def _effective_compression(compression):
+    # Cached so a misconfiguration is only logged once.
+    if compression not in COMPRESSIONS:
+        logging.warning("Unknown WEBHOOK_PAYLOAD_COMPRESSION %s; storing uncompressed.", compression)
+        return "none"
+    if compression == "zstd" and zstandard is None:
+        logging.warning("zstandard is not installed; falling back to gzip compression.")
+        return "gzip"
+    return compression
+
+
+def compress(body, compression, level=None):
+    if compression == "gzip":
+        return gzip.compress(body, compresslevel=6 if level is None else level)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compress(body)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def decompress(data, encoding):
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd payloads.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown payload encoding: {encoding}")
+
+
+def build_raw_row(body, compression="none", level=None, received_at=None):
+    """
+    Builds a helius_hook row from the raw request body without parsing it.
+    Uncompressed bodies go into the text 'payload' column; compressed ones
+    into the bytea 'payload_raw' column with 'payload_encoding' set.
+    """
+    row = {"received_at": received_at or datetime.utcnow()}
+    if compression == "none":
+        row["payload"] = body.decode("utf-8")
+    else:
+        row["payload"] = None
+        row["payload_raw"] = compress(body, compression, level)
+        row["payload_encoding"] = compression
+    return row
+
+
+def row_from_env(body):
+    """
+    Builds a helius_hook row using WEBHOOK_PAYLOAD_COMPRESSION
+    ("none", "gzip" or "zstd") and WEBHOOK_COMPRESSION_LEVEL.
+    """
+    return build_raw_row(body, compression_from_env(), get_config().compression_level)
+
+
+def loads(data):
+    """
+    Parses JSON text or bytes, with orjson when installed.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def payload_text(payload, payload_raw=None, payload_encoding=None):
+    """
+    Returns the stored payload as JSON text, decompressing payload_raw when
+    the row was stored compressed.
+    """
+    if payload_encoding:
+        return decompress(bytes(payload_raw), payload_encoding).decode("utf-8")
+    return payload
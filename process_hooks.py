@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# process_hooks.py
+"""
+Explodes unprocessed helius_hook payloads into the typed helius_transactions
+table.
+
+Rows are claimed in id order, one chunk per transaction, with
+FOR UPDATE SKIP LOCKED so several workers can drain the backlog in parallel
+without blocking each other. Each chunk is streamed through a server-side
+cursor, upserted by signature (so reprocessing is idempotent) and flagged
+processed in the same transaction. Rows whose payload cannot be decoded or
+mapped, or whose transactions Postgres rejects, get their process_error set
+and are not claimed again. After each pass the
+high-water mark is saved in helius_processor_state, and the next run resumes
+from it. Usage:
+
+    python process_hooks.py --workers 4 --chunk-size 1000
+"""
+import time
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime, timezone
+from sqlalchemy import text, table, column
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.exc import SQLAlchemyError, DataError, IntegrityError
+from db_engine import get_engine, connect, begin
+from db_helpers import hook_table
+from log_config import configure_logging
+from payload_codec import loads, payload_text
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS helius_transactions (
+        signature text PRIMARY KEY,
+        raw_id bigint NOT NULL,
+        slot bigint,
+        block_time timestamptz,
+        type text,
+        source text,
+        fee bigint,
+        fee_payer text,
+        description text,
+        token_transfers jsonb,
+        native_transfers jsonb,
+        transaction_error jsonb,
+        processed_at timestamptz NOT NULL DEFAULT now()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS helius_transactions_slot_idx ON helius_transactions (slot)",
+    "CREATE INDEX IF NOT EXISTS helius_transactions_fee_payer_idx ON helius_transactions (fee_payer)",
+    # Lets every chunk query jump straight to the unprocessed rows.
+    "CREATE INDEX IF NOT EXISTS helius_hook_unprocessed_idx ON helius_hook (id) WHERE NOT processed",
+    "ALTER TABLE helius_hook ADD COLUMN IF NOT EXISTS payload_raw bytea",
+    "ALTER TABLE helius_hook ADD COLUMN IF NOT EXISTS payload_encoding text",
+    # Dead-letter marker for rows that cannot be processed.
+    "ALTER TABLE helius_hook ADD COLUMN IF NOT EXISTS process_error text",
+    # Dedup key; the unique index backs ON CONFLICT (payload_hash) in the listeners.
+    "ALTER TABLE helius_hook ADD COLUMN IF NOT EXISTS payload_hash bytea",
+    "CREATE UNIQUE INDEX IF NOT EXISTS helius_hook_payload_hash_idx ON helius_hook (payload_hash)",
+    """
+    CREATE TABLE IF NOT EXISTS helius_processor_state (
+        name text PRIMARY KEY,
+        high_water_mark bigint NOT NULL,
+        updated_at timestamptz NOT NULL DEFAULT now()
+    )
+    """,
+]
+
+helius_hook = hook_table()
+
+# Row of helius_processor_state holding this processor's high-water mark.
+STATE_NAME = "helius_transactions"
+
+helius_transactions = table(
+    "helius_transactions",
+    column("signature"),
+    column("raw_id"),
+    column("slot"),
+    column("block_time"),
+    column("type"),
+    column("source"),
+    column("fee"),
+    column("fee_payer"),
+    column("description"),
+    column("token_transfers", JSONB),
+    column("native_transfers", JSONB),
+    column("transaction_error", JSONB),
+    column("processed_at"),
+)
+
+UPSERT_COLUMNS = (
+    "raw_id", "slot", "block_time", "type", "source", "fee", "fee_payer",
+    "description", "token_transfers", "native_transfers", "transaction_error",
+)
+UPSERT_BATCH_SIZE = 1000
+
+CLAIM_CHUNK_SQL = text("""
+    SELECT id, payload, payload_raw, payload_encoding
+    FROM helius_hook
+    WHERE NOT processed AND process_error IS NULL AND id > :after
+    ORDER BY id
+    LIMIT :chunk_size
+    FOR UPDATE SKIP LOCKED
+""")
+
+# Every row at or below the mark is processed or dead-lettered.
+HIGH_WATER_MARK_SQL = text("""
+    SELECT COALESCE(
+        (SELECT min(id) - 1 FROM helius_hook WHERE NOT processed AND process_error IS NULL),
+        (SELECT max(id) FROM helius_hook),
+        0
+    )
+""")
+
+SAVE_HIGH_WATER_MARK_SQL = text("""
+    INSERT INTO helius_processor_state (name, high_water_mark)
+    VALUES (:name, :mark)
+    ON CONFLICT (name) DO UPDATE
+    SET high_water_mark = EXCLUDED.high_water_mark, updated_at = now()
+""")
+
+
+def ensure_schema():
+    """
+    Creates helius_transactions and the supporting indexes if missing.
+    """
+    with begin() as connection:
+        for statement in SCHEMA_STATEMENTS:
+            connection.execute(text(statement))
+    logging.info("helius_transactions schema is up to date.")
+
+
+def transaction_row(raw_id, transaction):
+    """
+    Maps one enhanced transaction to a helius_transactions row, or returns
+    None if it has no signature.
+    """
+    signature = transaction.get("signature")
+    if not signature:
+        return None
+    timestamp = transaction.get("timestamp")
+    return {
+        "signature": signature,
+        "raw_id": raw_id,
+        "slot": transaction.get("slot"),
+        "block_time": (datetime.fromtimestamp(float(timestamp), tz=timezone.utc)
+                       if timestamp else None),
+        "type": transaction.get("type"),
+        "source": transaction.get("source"),
+        "fee": transaction.get("fee"),
+        "fee_payer": transaction.get("feePayer"),
+        "description": transaction.get("description"),
+        "token_transfers": transaction.get("tokenTransfers") or [],
+        "native_transfers": transaction.get("nativeTransfers") or [],
+        "transaction_error": transaction.get("transactionError"),
+    }
+
+
+def explode_payload(raw_id, payload):
+    """
+    Returns the helius_transactions rows for one helius_hook payload (a list
+    of enhanced transactions, or a single one).
+    """
+    transactions = payload if isinstance(payload, list) else [payload]
+    rows = []
+    for transaction in transactions:
+        if isinstance(transaction, dict):
+            row = transaction_row(raw_id, transaction)
+            if row is not None:
+                rows.append(row)
+    return rows
+
+
+def upsert_transactions(connection, rows):
+    if not rows:
+        return
+    # A signature may repeat within one chunk (replayed deliveries); ON
+    # CONFLICT cannot touch the same row twice in one statement.
+    unique_rows = list({row["signature"]: row for row in rows}.values())
+    # Stay well below Postgres' 65535 bind parameter limit per statement.
+    for start in range(0, len(unique_rows), UPSERT_BATCH_SIZE):
+        statement = insert(helius_transactions).values(unique_rows[start:start + UPSERT_BATCH_SIZE])
+        excluded = statement.excluded
+        statement = statement.on_conflict_do_update(
+            index_elements=["signature"],
+            set_={name: excluded[name] for name in UPSERT_COLUMNS},
+        )
+        connection.execute(statement)
+
+
+def dead_letter(connection, raw_id, error):
+    """
+    Sets process_error on a helius_hook row so it is not claimed again.
+    """
+    # DB errors carry the whole statement; the driver's message is enough.
+    message = str(getattr(error, "orig", None) or error) or type(error).__name__
+    logging.error("Dead-lettering helius_hook row %s: %s", raw_id, message)
+    connection.execute(
+        helius_hook.update()
+        .where(helius_hook.c.id == raw_id)
+        .values(process_error=message[:1000])
+    )
+
+
+def upsert_rows(connection, rows_by_id):
+    """
+    Upserts the transactions of several helius_hook rows ({raw_id: rows})
+    under a savepoint. If Postgres rejects the data, each helius_hook row is
+    retried on its own and the ones still rejected are dead-lettered, so one
+    bad row cannot fail its chunk on every pass. Returns the ids stored.
+    """
+    if not rows_by_id:
+        return []
+    try:
+        with connection.begin_nested():
+            upsert_transactions(connection, [row for rows in rows_by_id.values() for row in rows])
+        return list(rows_by_id)
+    except (DataError, IntegrityError) as e:
+        logging.warning("Retrying %s helius_hook rows one at a time: %s",
+                        len(rows_by_id), getattr(e, "orig", e))
+    stored = []
+    for raw_id, rows in rows_by_id.items():
+        try:
+            with connection.begin_nested():
+                upsert_transactions(connection, rows)
+        except (DataError, IntegrityError) as e:
+            dead_letter(connection, raw_id, e)
+            continue
+        stored.append(raw_id)
+    return stored
+
+
+def process_chunk(after=0, chunk_size=1000, fetch_size=100):
+    """
+    Claims up to chunk_size unprocessed rows with id > after, upserts their
+    transactions and marks them processed, all in one transaction. Rows are
+    fetched fetch_size at a time from a server-side cursor so memory stays
+    bounded by fetch_size payloads.
+
+    Returns (rows_claimed, last_id, transactions_written). Rows that cannot
+    be processed are logged and get their process_error set, so they are not
+    claimed again.
+    """
+    claimed = 0
+    last_id = after
+    written = 0
+    with begin() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=fetch_size).execute(
+            CLAIM_CHUNK_SQL, {"after": after, "chunk_size": chunk_size}
+        )
+        for partition in result.partitions(fetch_size):
+            rows_by_id = {}
+            for raw_id, payload, payload_raw, payload_encoding in partition:
+                claimed += 1
+                last_id = raw_id
+                try:
+                    parsed = loads(payload_text(payload, payload_raw, payload_encoding))
+                    rows_by_id[raw_id] = explode_payload(raw_id, parsed)
+                except Exception as e:
+                    # Corrupt compressed data (OSError, EOFError, zlib and zstd
+                    # errors), invalid JSON or unexpected field types: the
+                    # problem is this row's, not the chunk's.
+                    dead_letter(connection, raw_id, e)
+            done_ids = upsert_rows(connection, rows_by_id)
+            if done_ids:
+                connection.execute(
+                    helius_hook.update()
+                    .where(helius_hook.c.id.in_(done_ids))
+                    .values(processed=True)
+                )
+            written += sum(len(rows_by_id[raw_id]) for raw_id in done_ids)
+    return claimed, last_id, written
+
+
+def process_backlog(after=0, chunk_size=1000, fetch_size=100):
+    """
+    Processes chunks until no unprocessed rows remain past the high-water
+    mark. The mark advances past every claimed chunk (including rows that
+    failed to parse), so a worker never rescans rows it already handled.
+    Returns the final high-water mark.
+    """
+    if get_engine() is None:
+        return after
+    total_rows = 0
+    total_transactions = 0
+    start = time.monotonic()
+    while True:
+        try:
+            claimed, after, written = process_chunk(after, chunk_size, fetch_size)
+        except SQLAlchemyError as e:
+            logging.error("Error processing helius_hook chunk after id %s: %s", after, e)
+            break
+        if not claimed:
+            break
+        total_rows += claimed
+        total_transactions += written
+        logging.info("Processed %s helius_hook rows (%s transactions) up to id %s",
+                     claimed, written, after)
+    elapsed = time.monotonic() - start
+    logging.info("Backlog pass done: %s rows, %s transactions in %.1fs (high-water mark %s)",
+                 total_rows, total_transactions, elapsed, after)
+    return after
+
+
+def load_high_water_mark():
+    """
+    Returns the saved high-water mark, or 0 if none was saved yet.
+    """
+    with connect() as connection:
+        mark = connection.execute(
+            text("SELECT high_water_mark FROM helius_processor_state WHERE name = :name"),
+            {"name": STATE_NAME},
+        ).scalar()
+    return mark or 0
+
+
+def save_high_water_mark():
+    """
+    Computes the highest id below which every helius_hook row is processed
+    or dead-lettered, saves it and returns it. Taken from the table rather
+    than from the workers, so a worker that died mid-chunk cannot push the
+    mark past rows it never committed.
+    """
+    with begin() as connection:
+        mark = connection.execute(HIGH_WATER_MARK_SQL).scalar()
+        connection.execute(SAVE_HIGH_WATER_MARK_SQL, {"name": STATE_NAME, "mark": mark})
+    return mark
+
+
+def _worker(after, chunk_size, fetch_size):
+    configure_logging()
+    process_backlog(after, chunk_size, fetch_size)
+
+
+def run_workers(workers=1, after=0, chunk_size=1000, fetch_size=100):
+    """
+    Drains the backlog with `workers` processes. SKIP LOCKED hands each
+    worker disjoint chunks.
+    """
+    if workers <= 1:
+        return process_backlog(after, chunk_size, fetch_size)
+    processes = [
+        multiprocessing.Process(target=_worker, args=(after, chunk_size, fetch_size))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="rows claimed per transaction")
+    parser.add_argument("--fetch-size", type=int, default=100,
+                        help="rows fetched per round trip from the server-side cursor")
+    parser.add_argument("--after", type=int, default=None,
+                        help="start after this helius_hook id instead of the saved high-water mark")
+    parser.add_argument("--lookback", type=int, default=1000,
+                        help="ids to rescan below the mark, for rows committed out of id order")
+    parser.add_argument("--loop", action="store_true",
+                        help="keep polling for new rows")
+    parser.add_argument("--interval", type=float, default=10,
+                        help="seconds between polls with --loop")
+    parser.add_argument("--skip-schema", action="store_true",
+                        help="do not create tables and indexes")
+    args = parser.parse_args()
+
+    configure_logging()
+    if get_engine() is None:
+        return
+    if not args.skip_schema:
+        ensure_schema()
+    if args.after is not None:
+        start = args.after
+    else:
+        start = max(load_high_water_mark() - args.lookback, 0)
+    while True:
+        run_workers(args.workers, start, args.chunk_size, args.fetch_size)
+        mark = save_high_water_mark()
+        logging.info("Saved high-water mark %s", mark)
+        if not args.loop:
+            return
+        time.sleep(args.interval)
+        start = max(mark - args.lookback, 0)
+
+
+if __name__ == "__main__":
+    main()
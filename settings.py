@@ -0,0 +1,219 @@
+# settings.py
+import os
+import logging
+import threading
+from dataclasses import dataclass
+
+_dotenv_loaded = False
+_config = None
+_config_lock = threading.Lock()
+
+
+def load_dotenv_once():
+    """
+    Loads the .env file next to this module into os.environ, once per
+    process. Variables already set in the environment take precedence.
+    """
+    global _dotenv_loaded
+    if _dotenv_loaded:
+        return
+    with _config_lock:
+        if not _dotenv_loaded:
+            from dotenv import load_dotenv, find_dotenv
+            dotenv_path = find_dotenv()
+            if dotenv_path:
+                load_dotenv(dotenv_path)
+            _dotenv_loaded = True
+
+
+def env_int(name, default):
+    """
+    Reads an integer environment variable, falling back to the default if it
+    is unset or invalid.
+    """
+    load_dotenv_once()
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        logging.warning("Invalid value for %s; using default %s", name, default)
+        return default
+
+
+def env_float(name, default):
+    """
+    Reads a float environment variable, falling back to the default if it is
+    unset or invalid.
+    """
+    load_dotenv_once()
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        logging.warning("Invalid value for %s; using default %s", name, default)
+        return default
+
+
+def env_bool(name, default):
+    """
+    Reads a boolean environment variable ("1", "true", "yes", "on" are true).
+    """
+    load_dotenv_once()
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_str(name, default=None):
+    load_dotenv_once()
+    return os.getenv(name, default)
+
+
+@dataclass(frozen=True)
+class Config:
+    """
+    Service configuration, read from the environment (and .env) once per
+    process, so no module parses environment variables after start-up.
+    """
+    database_url: str = None
+    helius_api_key: str = None
+    new_webhook_url: str = None
+    port: int = 5000
+    raw_body: bool = False
+    validate_strict: bool = False
+    payload_compression: str = "none"
+    compression_level: int = None
+    max_body_bytes: int = 0
+    dedup: bool = False
+    buffered: bool = False
+    buffer_durable: bool = False
+    buffer_ack_timeout: float = 10.0
+    log_level: str = "INFO"
+    log_format: str = "json"
+    log_sample_rate: float = 0.01
+    profiling: bool = False
+    profile_dir: str = None
+    metrics_enabled: bool = False
+    metrics_token: str = None
+    # Write-behind buffer
+    buffer_max_queue: int = 10000
+    buffer_batch_size: int = 500
+    buffer_flush_interval: float = 0.5
+    buffer_method: str = "insert"
+    # Duplicate cache
+    dedup_cache_size: int = 100000
+    dedup_ttl: float = 3600.0
+    # Database pools
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pool_min_size: int = 1
+    db_command_timeout: float = 30.0
+    asgi_workers: int = 1
+    # Airflow DAG triggers
+    airflow_dag_run_url: str = "http://localhost:8080/api/v1/dags/helius_webhook_notification_dag/dagRuns"
+    airflow_username: str = "admin"
+    airflow_password: str = "password"
+    airflow_timeout: float = 10.0
+    airflow_retries: int = 3
+    airflow_retry_backoff: float = 0.5
+    dag_trigger_interval: float = 60.0
+    dag_trigger_conf_mode: str = "list"
+    dag_trigger_max_ids: int = 1000
+    dag_trigger_lock_file: str = None
+    # Helius address sync
+    helius_transaction_types: tuple = ("SWAP",)
+    helius_webhook_type: str = "enhanced"
+    helius_auth_header: str = ""
+    helius_webhook_id: str = None
+    helius_webhook_cache: str = ".helius_webhooks.json"
+    # Helius caps the number of account addresses on a single webhook.
+    helius_max_addresses_per_webhook: int = 100000
+    helius_sync_interval: float = 300.0
+    address_max_age_days: int = 30
+
+    @classmethod
+    def from_env(cls):
+        compression_level = env_int("WEBHOOK_COMPRESSION_LEVEL", -1)
+        return cls(
+            database_url=env_str("DATABASE_URL"),
+            helius_api_key=env_str("HELIUS_API_KEY"),
+            new_webhook_url=env_str("NEW_WEBHOOK_URL"),
+            port=env_int("PORT", 5000),
+            raw_body=env_bool("WEBHOOK_RAW_BODY", False),
+            validate_strict=env_str("WEBHOOK_VALIDATE", "cheap").strip().lower() == "strict",
+            payload_compression=env_str("WEBHOOK_PAYLOAD_COMPRESSION", "none").strip().lower(),
+            compression_level=None if compression_level < 0 else compression_level,
+            max_body_bytes=env_int("WEBHOOK_MAX_BYTES", 0),
+            dedup=env_bool("WEBHOOK_DEDUP", False),
+            buffered=env_bool("WEBHOOK_BUFFERED", False),
+            buffer_durable=env_bool("WEBHOOK_BUFFER_DURABLE", False),
+            buffer_ack_timeout=env_float("WEBHOOK_BUFFER_ACK_TIMEOUT", 10),
+            log_level=env_str("LOG_LEVEL", "INFO").strip().upper(),
+            log_format=env_str("LOG_FORMAT", "json").strip().lower(),
+            log_sample_rate=env_float("LOG_SAMPLE_RATE", 0.01),
+            profiling=env_bool("WEBHOOK_PROFILING", False),
+            profile_dir=env_str("WEBHOOK_PROFILE_DIR"),
+            metrics_enabled=env_bool("WEBHOOK_METRICS", False),
+            metrics_token=env_str("WEBHOOK_METRICS_TOKEN") or None,
+            buffer_max_queue=env_int("WEBHOOK_BUFFER_MAX_QUEUE", 10000),
+            buffer_batch_size=env_int("WEBHOOK_BUFFER_BATCH_SIZE", 500),
+            buffer_flush_interval=env_float("WEBHOOK_BUFFER_FLUSH_INTERVAL", 0.5),
+            buffer_method=env_str("WEBHOOK_BUFFER_METHOD", "insert").strip().lower(),
+            dedup_cache_size=env_int("DEDUP_CACHE_SIZE", 100000),
+            dedup_ttl=env_float("DEDUP_TTL", 3600),
+            db_pool_size=env_int("DB_POOL_SIZE", 5),
+            db_max_overflow=env_int("DB_MAX_OVERFLOW", 10),
+            db_pool_timeout=env_float("DB_POOL_TIMEOUT", 30),
+            db_pool_recycle=env_int("DB_POOL_RECYCLE", 1800),
+            db_pool_pre_ping=env_bool("DB_POOL_PRE_PING", True),
+            db_pool_min_size=env_int("DB_POOL_MIN_SIZE", 1),
+            db_command_timeout=env_float("DB_COMMAND_TIMEOUT", 30),
+            asgi_workers=env_int("ASGI_WORKERS", 1),
+            airflow_dag_run_url=env_str("AIRFLOW_DAG_RUN_URL", cls.airflow_dag_run_url),
+            airflow_username=env_str("AIRFLOW_USERNAME", "admin"),
+            airflow_password=env_str("AIRFLOW_PASSWORD", "password"),
+            airflow_timeout=env_float("AIRFLOW_TIMEOUT", 10),
+            airflow_retries=env_int("AIRFLOW_RETRIES", 3),
+            airflow_retry_backoff=env_float("AIRFLOW_RETRY_BACKOFF", 0.5),
+            dag_trigger_interval=env_float("DAG_TRIGGER_INTERVAL", 60),
+            dag_trigger_conf_mode=env_str("DAG_TRIGGER_CONF_MODE", "list").strip().lower(),
+            dag_trigger_max_ids=env_int("DAG_TRIGGER_MAX_IDS", 1000),
+            dag_trigger_lock_file=env_str("DAG_TRIGGER_LOCK_FILE") or None,
+            helius_transaction_types=tuple(
+                x.strip() for x in env_str("HELIUS_TRANSACTION_TYPES", "SWAP").split(",")
+            ),
+            helius_webhook_type=env_str("HELIUS_WEBHOOK_TYPE", "enhanced"),
+            helius_auth_header=env_str("HELIUS_AUTH_HEADER", ""),
+            helius_webhook_id=env_str("HELIUS_WEBHOOK_ID") or None,
+            helius_webhook_cache=env_str("HELIUS_WEBHOOK_CACHE", ".helius_webhooks.json"),
+            helius_max_addresses_per_webhook=env_int("HELIUS_MAX_ADDRESSES_PER_WEBHOOK", 100000),
+            helius_sync_interval=env_float("HELIUS_SYNC_INTERVAL", 300),
+            address_max_age_days=env_int("HELIUS_ADDRESS_MAX_AGE_DAYS", 30),
+        )
+
+
+def get_config():
+    """
+    Returns the process-wide Config, loading it on first use.
+    """
+    global _config
+    config = _config
+    if config is None:
+        load_dotenv_once()
+        with _config_lock:
+            if _config is None:
+                _config = Config.from_env()
+            config = _config
+    return config
+
+
+def reset_config():
+    """
+    Forgets the loaded Config so the next get_config() re-reads the
+    environment (e.g. after changing os.environ in a script).
+    """
+    global _config
+    with _config_lock:
+        _config = None
@@ -0,0 +1,64 @@
+# tests/test_asgi_app.py
+import asyncio
+import contextlib
+from unittest import mock
+
+import asyncpg
+import pytest
+
+import asgi_app
+from settings import Config
+
+
+class FakePool:
+    """
+    Stands in for an asyncpg pool, handing out one connection.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.timeouts = []
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        self.timeouts.append(timeout)
+        yield self.connection
+
+
+@pytest.fixture
+def pool():
+    fake = FakePool(mock.AsyncMock())
+    config = Config(db_pool_timeout=2.5)
+    with mock.patch.object(asgi_app, "_pool", fake), \
+            mock.patch.object(asgi_app, "get_config", return_value=config):
+        yield fake
+
+
+def test_insert_waits_at_most_pool_timeout_for_a_connection(pool):
+    pool.connection.fetchval.return_value = 42
+    assert asyncio.run(asgi_app.insert_raw_row_async({"payload": "{}"})) == 42
+    assert pool.timeouts == [2.5]
+
+
+@pytest.mark.parametrize("error", [
+    asyncpg.ConnectionDoesNotExistError("connection was closed in the middle of operation"),
+    asyncpg.InterfaceError("cannot perform operation: another operation is in progress"),
+    asyncio.TimeoutError(),
+])
+def test_insert_returns_none_and_counts_lost_connections(pool, error):
+    pool.connection.fetchval.side_effect = error
+    with mock.patch.object(asgi_app, "count_error") as count_error:
+        assert asyncio.run(asgi_app.insert_raw_row_async({"payload": "{}"})) is None
+    count_error.assert_called_once_with("insert")
+
+
+def test_startup_uses_command_timeout_for_queries():
+    config = Config(database_url="postgresql://localhost/db",
+                    db_pool_timeout=5, db_command_timeout=60)
+    create_pool = mock.AsyncMock()
+    with mock.patch.object(asgi_app, "get_config", return_value=config), \
+            mock.patch.object(asgi_app, "configure_logging"), \
+            mock.patch.object(asgi_app.asyncpg, "create_pool", create_pool):
+        asyncio.run(asgi_app.startup())
+    assert create_pool.call_args.kwargs["command_timeout"] == 60
+    asyncio.run(asgi_app.shutdown())
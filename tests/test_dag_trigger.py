@@ -0,0 +1,161 @@
+# tests/test_dag_trigger.py
+import time
+import threading
+from unittest import mock
+
+import pytest
+
+import dag_trigger
+from dag_trigger import FileTriggerGate, PendingIds, TriggerDispatcher, build_conf
+
+
+def pending(ids, max_ids=1000):
+    result = PendingIds(max_ids)
+    result.add(ids)
+    return result
+
+
+def test_build_conf_list_and_range():
+    assert build_conf([3, 1, 2, 2]) == {"raw_id": 3, "count": 3, "raw_ids": [1, 2, 3]}
+    assert build_conf([3, 1, 2], mode="range") == {
+        "raw_id": 3, "count": 3, "min_raw_id": 1, "max_raw_id": 3,
+    }
+
+
+def test_build_conf_falls_back_to_range_above_cap():
+    conf = build_conf(range(1, 11), max_ids=5)
+    assert "raw_ids" not in conf
+    assert conf == {"raw_id": 10, "count": 10, "min_raw_id": 1, "max_raw_id": 10}
+
+
+def test_pending_ids_collapse_to_range():
+    ids = pending([1, 2, 3], max_ids=3)
+    assert ids.conf()["raw_ids"] == [1, 2, 3]
+    ids.add([7])
+    assert ids.ids is None
+    assert ids.conf() == {"raw_id": 7, "count": 4, "min_raw_id": 1, "max_raw_id": 7}
+    ids.add([0])
+    assert (ids.min_id, ids.max_id, len(ids)) == (0, 7, 5)
+
+
+def test_pending_ids_merge_and_state_round_trip():
+    collapsed = pending(range(10), max_ids=5)
+    exact = pending([20, 21], max_ids=5)
+    exact.merge(collapsed)
+    assert exact.ids is None
+    assert (exact.min_id, exact.max_id, len(exact)) == (0, 21, 12)
+    restored = PendingIds.from_state(exact.to_state(), max_ids=5)
+    assert restored.conf() == exact.conf()
+    assert PendingIds.from_state(pending([4, 5]).to_state()).conf()["raw_ids"] == [4, 5]
+
+
+def test_file_gate_spools_within_window(tmp_path):
+    gate = FileTriggerGate(str(tmp_path / "trigger.json"))
+    claimed, wait = gate.claim(pending([1, 2]), window=60)
+    assert claimed.conf()["raw_ids"] == [1, 2]
+    assert wait is None
+
+    # A second worker inside the window spools its ids.
+    claimed, wait = gate.claim(pending([3]), window=60)
+    assert claimed is None
+    assert 0 < wait <= 60
+
+    # Once the window reopens, the next claim takes the whole spool.
+    claimed, wait = gate.claim(pending([4]), window=0)
+    assert claimed.conf()["raw_ids"] == [3, 4]
+
+
+def test_file_gate_empty_spool_is_noop_unless_forced(tmp_path):
+    gate = FileTriggerGate(str(tmp_path / "trigger.json"))
+    claimed, wait = gate.claim(PendingIds(), window=0)
+    assert not len(claimed) and wait is None
+    claimed, wait = gate.claim(PendingIds(), window=60, force=True)
+    assert claimed is not None and not len(claimed)
+    # The forced claim opened a window.
+    claimed, wait = gate.claim(pending([1]), window=60)
+    assert claimed is None
+
+
+def test_file_gate_spool_stays_bounded(tmp_path):
+    gate = FileTriggerGate(str(tmp_path / "trigger.json"))
+    gate.claim(PendingIds(max_ids=5), window=60, force=True)
+    for start in range(0, 100, 10):
+        gate.claim(pending(range(start, start + 10), max_ids=5), window=60)
+    claimed, _ = gate.claim(PendingIds(max_ids=5), window=0)
+    assert claimed.conf() == {"raw_id": 99, "count": 100, "min_raw_id": 0, "max_raw_id": 99}
+
+
+class FakeAirflow:
+    """
+    Stands in for trigger_helius_dag, recording every conf sent.
+    """
+
+    def __init__(self, succeed=True):
+        self.succeed = succeed
+        self.confs = []
+        self.sent = threading.Event()
+
+    def __call__(self, conf, session=None, timeout=None):
+        self.confs.append(conf)
+        self.sent.set()
+        return self.succeed
+
+
+@pytest.fixture
+def airflow():
+    fake = FakeAirflow()
+    with mock.patch.object(dag_trigger, "trigger_helius_dag", fake), \
+            mock.patch.object(dag_trigger, "create_session", lambda *args: mock.Mock()):
+        yield fake
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+
+def test_dispatcher_coalesces_ids_within_window(airflow):
+    dispatcher = TriggerDispatcher(window=0.5)
+    dispatcher.start()
+    try:
+        dispatcher.submit({"raw_id": 1})
+        wait_for(lambda: len(airflow.confs) == 1)
+        for raw_id in range(2, 12):
+            dispatcher.submit({"raw_id": raw_id})
+        wait_for(lambda: len(airflow.confs) == 2)
+    finally:
+        dispatcher.stop()
+    assert airflow.confs[0]["raw_ids"] == [1]
+    assert airflow.confs[1]["raw_ids"] == list(range(2, 12))
+
+
+def test_dispatcher_stop_flushes_pending(airflow):
+    dispatcher = TriggerDispatcher(window=60)
+    dispatcher.start()
+    dispatcher.submit({"raw_id": 1})
+    wait_for(lambda: len(airflow.confs) == 1)
+    dispatcher.submit({"raw_ids": [2, 3]})
+    dispatcher.stop()
+    assert airflow.confs[-1]["raw_ids"] == [2, 3]
+
+
+def test_dispatcher_requeues_failures_within_bound(airflow):
+    airflow.succeed = False
+    dispatcher = TriggerDispatcher(window=0.05, max_ids=5)
+    dispatcher.start()
+    try:
+        for raw_id in range(20):
+            dispatcher.submit({"raw_id": raw_id})
+        wait_for(lambda: len(airflow.confs) >= 3)
+        airflow.succeed = True
+        dispatcher.submit({"raw_id": 20})
+        wait_for(lambda: airflow.confs[-1].get("max_raw_id") == 20)
+    finally:
+        dispatcher.stop()
+    last = airflow.confs[-1]
+    assert "raw_ids" not in last
+    assert last["min_raw_id"] == 0
+    assert dispatcher._pending.ids is not None and not len(dispatcher._pending)
@@ -0,0 +1,100 @@
+# tests/test_dedup.py
+import asyncio
+from unittest import mock
+
+import pytest
+
+import asgi_app
+import db_helpers
+import dedup
+from dedup import DedupCache, payload_key
+from settings import Config
+
+SIG_A = b"5" * 64
+SIG_B = b"3" * 64
+
+
+def body(*signatures, extra=b""):
+    transactions = b",".join(b'{"signature": "%s"%s}' % (signature, extra) for signature in signatures)
+    return b"[" + transactions + b"]"
+
+
+def test_payload_key_ignores_order_and_serialization():
+    assert payload_key(body(SIG_A, SIG_B)) == payload_key(body(SIG_B, SIG_A))
+    assert payload_key(body(SIG_A)) == payload_key(body(SIG_A, extra=b', "slot": 1'))
+    assert payload_key(body(SIG_A)) != payload_key(body(SIG_B))
+    assert len(payload_key(body(SIG_A))) == dedup.KEY_BYTES
+
+
+def test_payload_key_falls_back_to_body_without_signatures():
+    assert payload_key(b'{"a": 1}') != payload_key(b'{"a": 2}')
+    assert payload_key(b'{"a": 1}') == payload_key(b'{"a": 1}')
+
+
+def test_cache_evicts_least_recently_seen():
+    cache = DedupCache(max_entries=2)
+    cache.add(b"a")
+    cache.add(b"b")
+    assert cache.seen(b"a")
+    cache.add(b"c")
+    assert not cache.seen(b"b")
+    assert cache.seen(b"a") and cache.seen(b"c")
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_cache_entries_expire_after_ttl():
+    cache = DedupCache(ttl=10)
+    with mock.patch.object(dedup.time, "monotonic", return_value=100):
+        cache.add(b"a")
+        assert cache.seen(b"a")
+    with mock.patch.object(dedup.time, "monotonic", return_value=111):
+        assert not cache.seen(b"a")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 0)
+
+
+def test_cache_exports_prometheus_metrics():
+    cache = DedupCache(max_entries=1)
+    with mock.patch.object(dedup, "record_dedup_lookup") as lookup, \
+            mock.patch.object(dedup, "record_dedup_cache") as size:
+        cache.seen(b"a")
+        cache.add(b"a")
+        cache.seen(b"a")
+        cache.add(b"b")
+    assert [call.args for call in lookup.call_args_list] == [(False,), (True,)]
+    assert [call.args for call in size.call_args_list] == [(1, 0), (1, 1)]
+
+
+def test_record_db_duplicate_caches_the_key():
+    cache = DedupCache()
+    cache.record_db_duplicate(b"a")
+    assert cache.seen(b"a")
+    assert cache.stats()["db_duplicates"] == 1
+
+
+def test_has_dedup_index_reports_missing_index_and_unreachable_database():
+    engine = mock.MagicMock()
+    connection = engine.connect.return_value
+    connection.execute.return_value.scalar.return_value = False
+    with mock.patch("db_helpers.get_engine", return_value=engine):
+        assert db_helpers.has_dedup_index() is False
+    from sqlalchemy.exc import OperationalError
+    engine.connect.side_effect = OperationalError("select", {}, OSError("refused"))
+    with mock.patch("db_helpers.get_engine", return_value=engine):
+        assert db_helpers.has_dedup_index() is None
+
+
+def test_asgi_startup_refuses_to_run_without_dedup_index():
+    pool = mock.AsyncMock()
+    pool.fetchval.return_value = False
+    config = Config(database_url="postgresql://localhost/db", dedup=True)
+    with mock.patch.object(asgi_app, "get_config", return_value=config), \
+            mock.patch.object(asgi_app, "configure_logging"), \
+            mock.patch.object(dedup, "get_config", return_value=config), \
+            mock.patch.object(asgi_app.asyncpg, "create_pool", mock.AsyncMock(return_value=pool)):
+        with pytest.raises(RuntimeError, match="payload_hash"):
+            asyncio.run(asgi_app.startup())
+    pool.fetchval.assert_awaited_once_with(db_helpers.DEDUP_INDEX_QUERY)
+    pool.close.assert_awaited_once()
+    assert asgi_app._pool is None
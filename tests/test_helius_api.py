@@ -0,0 +1,229 @@
+# tests/test_helius_api.py
+import os
+from unittest import mock
+
+import pytest
+
+import helius_api
+from helius_api import fetch_registered_shards, plan_shards, sync_addresses
+from settings import Config
+
+URL = "https://listener.example/webhooks"
+
+
+class FakeWebhooksAPI:
+    """
+    In-memory stand-in for helius.WebhooksAPI.
+    """
+
+    def __init__(self, webhooks=()):
+        self.webhooks = {webhook["webhookID"]: dict(webhook) for webhook in webhooks}
+        self.calls = []
+        self._next_id = 0
+
+    def get_all_webhooks(self):
+        self.calls.append(("get_all",))
+        return [dict(webhook) for webhook in self.webhooks.values()]
+
+    def edit_webhook(self, webhook_id, url, types, addresses, webhook_type, auth_header):
+        self.calls.append(("edit", webhook_id))
+        self.webhooks[webhook_id].update(webhookURL=url, accountAddresses=list(addresses))
+
+    def create_webhook(self, url, types, addresses, webhook_type, auth_header):
+        self._next_id += 1
+        webhook_id = f"created-{self._next_id}"
+        self.calls.append(("create", webhook_id))
+        self.webhooks[webhook_id] = {"webhookID": webhook_id, "webhookURL": url,
+                                     "accountAddresses": list(addresses)}
+        return {"webhookID": webhook_id}
+
+    def delete_webhook(self, webhook_id):
+        self.calls.append(("delete", webhook_id))
+        del self.webhooks[webhook_id]
+
+
+def test_plan_shards_keeps_addresses_in_place():
+    current = {"ours": {"a", "b"}}
+    shards, new_shards, empty_ids = plan_shards(current, {"a", "b", "c"}, 100)
+    assert shards == {"ours": {"a", "b", "c"}}
+    assert new_shards == [] and empty_ids == []
+
+
+def test_plan_shards_splits_above_limit():
+    shards, new_shards, empty_ids = plan_shards({"ours": {"a"}}, {"a", "b", "c", "d", "e"}, 2)
+    assert shards == {"ours": {"a", "b"}}
+    assert new_shards == [["c", "d"], ["e"]]
+
+
+def test_plan_shards_deletes_only_deletable():
+    current = {"ours": {"a"}, "shard": {"b"}, "other": {"c"}}
+    shards, _, empty_ids = plan_shards(current, {"a"}, 100, deletable={"shard"})
+    assert empty_ids == ["shard"]
+    # Nothing can be moved onto "other", so it is planned empty (and cleared).
+    assert shards["other"] == set()
+
+
+def test_plan_shards_moves_a_created_shard_onto_an_emptied_webhook():
+    current = {"ours": {"a"}, "created-1": {"b"}, "created-2": {"c", "d"}}
+    shards, new_shards, empty_ids = plan_shards(current, {"b", "c", "d"}, 2,
+                                                deletable={"created-1", "created-2"})
+    assert shards["ours"] == {"b"}
+    assert empty_ids == ["created-1"]
+    assert shards["created-2"] == {"c", "d"} and new_shards == []
+
+
+def test_fetch_registered_shards_ignores_foreign_webhooks():
+    api = FakeWebhooksAPI([
+        {"webhookID": "other", "webhookURL": "https://someone.else/hook", "accountAddresses": ["X1"]},
+        {"webhookID": "ours", "webhookURL": "https://old-tunnel/webhooks", "accountAddresses": ["a"]},
+        {"webhookID": "same-url", "webhookURL": URL, "accountAddresses": ["b"]},
+    ])
+    assert fetch_registered_shards(api, {"ours"}, URL) == {"ours": {"a"}, "same-url": {"b"}}
+
+
+@pytest.fixture
+def sync(tmp_path):
+    config = Config(helius_api_key="key", helius_webhook_id="ours",
+                    helius_max_addresses_per_webhook=2)
+    cache_path = str(tmp_path / "webhooks.json")
+
+    def run(api, addresses, config=config, **kwargs):
+        with mock.patch.object(helius_api, "get_config", return_value=config), \
+                mock.patch.object(helius_api, "fetch_addresses_from_db", return_value=addresses):
+            return sync_addresses(URL, webhooks_api=api, cache_path=cache_path, **kwargs)
+    return run
+
+
+def foreign_webhook():
+    return {"webhookID": "other", "webhookURL": "https://someone.else/hook",
+            "accountAddresses": ["X1", "X2"]}
+
+
+def test_sync_never_touches_foreign_webhooks(sync):
+    api = FakeWebhooksAPI([
+        foreign_webhook(),
+        {"webhookID": "ours", "webhookURL": "https://old-tunnel/webhooks", "accountAddresses": ["a"]},
+    ])
+    assert sync(api, ["a", "b", "c"])
+    assert api.webhooks["other"] == foreign_webhook()
+    assert set(api.webhooks["ours"]["accountAddresses"]) == {"a", "b"}
+    assert api.webhooks["created-1"]["accountAddresses"] == ["c"]
+
+
+def test_sync_deletes_only_shards_it_created(sync):
+    api = FakeWebhooksAPI([
+        foreign_webhook(),
+        {"webhookID": "ours", "webhookURL": URL, "accountAddresses": ["a"]},
+    ])
+    assert sync(api, ["a", "b", "c"])
+    assert "created-1" in api.webhooks
+
+    # The address on the created shard goes away: that shard is deleted.
+    api.calls.clear()
+    assert sync(api, ["a", "b"])
+    assert ("delete", "created-1") in api.calls
+    assert "other" in api.webhooks and "ours" in api.webhooks
+
+    # Even with no addresses left on the owned webhook, it is not deleted.
+    api.calls.clear()
+    api.webhooks["ours"]["accountAddresses"] = []
+    assert sync(api, ["z"], force=True)
+    assert not any(call[0] == "delete" for call in api.calls)
+    assert api.webhooks["other"] == foreign_webhook()
+
+
+def test_sync_never_leaves_owned_webhook_with_stale_addresses(sync):
+    api = FakeWebhooksAPI([{"webhookID": "ours", "webhookURL": URL, "accountAddresses": []}])
+    config = Config(helius_api_key="key", helius_webhook_id="ours",
+                    helius_max_addresses_per_webhook=1)
+    assert sync(api, ["a", "b"], config=config)
+    assert "created-1" in api.webhooks
+    assert sync(api, ["b"], config=config)
+    assert api.webhooks == {"ours": {"webhookID": "ours", "webhookURL": URL,
+                                     "accountAddresses": ["b"]}}
+
+
+def test_sync_clears_matched_webhook_with_no_addresses_left(sync):
+    api = FakeWebhooksAPI([
+        {"webhookID": "ours", "webhookURL": URL, "accountAddresses": ["a"]},
+        {"webhookID": "same-url", "webhookURL": URL, "accountAddresses": ["b"]},
+    ])
+    assert sync(api, ["a"])
+    assert api.webhooks["same-url"]["accountAddresses"] == []
+    assert not any(call[0] == "delete" for call in api.calls)
+
+
+def test_sync_skips_helius_when_unchanged(sync):
+    api = FakeWebhooksAPI([{"webhookID": "ours", "webhookURL": URL, "accountAddresses": []}])
+    assert sync(api, ["a"])
+    api.calls.clear()
+    assert sync(api, ["a"])
+    assert api.calls == []
+
+
+def test_sync_remembers_created_shards_after_failure(sync):
+    api = FakeWebhooksAPI([{"webhookID": "ours", "webhookURL": URL, "accountAddresses": ["a"]}])
+    real_create = api.create_webhook
+
+    def create_once(*args):
+        if api._next_id:
+            raise RuntimeError("Helius down")
+        return real_create(*args)
+
+    api.create_webhook = create_once
+    assert not sync(api, ["a", "b", "c", "d", "e", "f"])
+    assert "created-1" in api.webhooks
+
+    api.create_webhook = real_create
+    # The tunnel URL changed, but the created shard is still ours to delete.
+    api.webhooks["created-1"]["webhookURL"] = "https://old-tunnel/webhooks"
+    assert sync(api, ["a"])
+    assert "created-1" not in api.webhooks
+
+
+@pytest.fixture
+def sync_without_id(tmp_path):
+    config = Config(helius_api_key="key", helius_max_addresses_per_webhook=2)
+    cache_path = str(tmp_path / "webhooks.json")
+
+    def run(api, addresses):
+        with mock.patch.object(helius_api, "get_config", return_value=config), \
+                mock.patch.object(helius_api, "fetch_addresses_from_db", return_value=addresses):
+            return sync_addresses(URL, webhooks_api=api, cache_path=cache_path)
+    return run
+
+
+def test_sync_adopts_the_only_existing_webhook(sync_without_id):
+    legacy = {"webhookID": "legacy", "webhookURL": "https://dead-tunnel/webhooks",
+              "accountAddresses": ["a"]}
+    api = FakeWebhooksAPI([legacy])
+    assert sync_without_id(api, ["a", "b"])
+    assert set(api.webhooks) == {"legacy"}
+    assert api.webhooks["legacy"]["webhookURL"] == URL
+
+    # The next tunnel URL still updates the adopted webhook.
+    api.webhooks["legacy"]["webhookURL"] = "https://older-tunnel/webhooks"
+    assert sync_without_id(api, ["a", "c"])
+    assert set(api.webhooks) == {"legacy"}
+    assert set(api.webhooks["legacy"]["accountAddresses"]) == {"a", "c"}
+
+
+def test_sync_refuses_to_guess_between_several_webhooks(sync_without_id):
+    api = FakeWebhooksAPI([foreign_webhook(),
+                           {"webhookID": "legacy", "webhookURL": "https://dead-tunnel/webhooks",
+                            "accountAddresses": ["a"]}])
+    assert not sync_without_id(api, ["a", "b"])
+    assert [call[0] for call in api.calls] == ["get_all"]
+
+
+def test_sync_creates_a_webhook_on_an_empty_account(sync_without_id):
+    api = FakeWebhooksAPI()
+    assert sync_without_id(api, ["a"])
+    assert set(api.webhooks) == {"created-1"}
+
+
+def test_relative_cache_path_is_next_to_module():
+    path = helius_api.resolve_cache_path(".helius_webhooks.json")
+    assert path == os.path.join(os.path.dirname(os.path.abspath(helius_api.__file__)),
+                                ".helius_webhooks.json")
+    assert helius_api.resolve_cache_path("/tmp/cache.json") == "/tmp/cache.json"
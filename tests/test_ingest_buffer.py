@@ -0,0 +1,155 @@
+# tests/test_ingest_buffer.py
+import threading
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+import ingest_buffer
+from db_helpers import DUPLICATE
+from ingest_buffer import BufferFull, BufferedWriter
+
+
+def row(n, payload_hash=None):
+    result = {"payload": f'{{"n": {n}}}', "received_at": datetime(2024, 1, 1)}
+    if payload_hash is not None:
+        result["payload_hash"] = payload_hash
+    return result
+
+
+class FakeInsert:
+    """
+    Stands in for db_helpers.insert_raw_payloads, recording every batch.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, rows):
+        self.release.wait(5)
+        self.batches.append(list(rows))
+        if self.fail:
+            return None
+        return [len(self.batches) * 1000 + i for i in range(len(rows))]
+
+
+@pytest.fixture
+def insert():
+    fake = FakeInsert()
+    with mock.patch.object(ingest_buffer, "insert_raw_payloads", fake):
+        yield fake
+
+
+def test_batches_resolve_futures_and_call_on_commit(insert):
+    committed = []
+    writer = BufferedWriter(batch_size=3, flush_interval=0.05,
+                            on_commit=lambda ids, count: committed.append((ids, count)))
+    writer.start()
+    futures = [writer.submit_row(row(n)) for n in range(3)]
+    assert [future.result(timeout=5) for future in futures] == [1000, 1001, 1002]
+    writer.stop()
+    assert committed == [([1000, 1001, 1002], 3)]
+
+
+def test_duplicates_resolve_to_duplicate_and_skip_on_commit(insert):
+    committed = []
+    writer = BufferedWriter(flush_interval=0.05,
+                            on_commit=lambda ids, count: committed.append((ids, count)))
+    with mock.patch.object(ingest_buffer, "insert_raw_payloads",
+                           lambda rows: [DUPLICATE] * len(rows)):
+        writer.start()
+        assert writer.submit_row(row(1, b"h")).result(timeout=5) is DUPLICATE
+        writer.stop()
+    assert committed == []
+
+
+def test_failed_batch_fails_futures(insert):
+    insert.fail = True
+    writer = BufferedWriter(flush_interval=0.05)
+    writer.start()
+    future = writer.submit_row(row(1))
+    with pytest.raises(RuntimeError):
+        future.result(timeout=5)
+    writer.stop()
+
+
+def test_exception_in_write_keeps_flusher_running(insert):
+    writer = BufferedWriter(flush_interval=0.05)
+    with mock.patch.object(ingest_buffer, "insert_raw_payloads",
+                           side_effect=[ConnectionError("refused"), [7]]):
+        writer.start()
+        with pytest.raises(ConnectionError):
+            writer.submit_row(row(1)).result(timeout=5)
+        assert writer.submit_row(row(2)).result(timeout=5) == 7
+        writer.stop()
+
+
+def test_cancelled_rows_are_not_written(insert):
+    insert.release.clear()
+    writer = BufferedWriter(batch_size=1, flush_interval=0.05)
+    writer.start()
+    first = writer.submit_row(row(1))
+    second = writer.submit_row(row(2))
+    assert second.cancel()
+    insert.release.set()
+    assert first.result(timeout=5) == 1000
+    writer.stop()
+    assert insert.batches == [[row(1)]]
+
+
+def test_stop_drains_queue(insert):
+    writer = BufferedWriter(batch_size=2, flush_interval=60)
+    writer.start()
+    futures = [writer.submit_row(row(n)) for n in range(5)]
+    writer.stop()
+    assert all(future.done() and not future.exception() for future in futures)
+    assert sum(len(batch) for batch in insert.batches) == 5
+    with pytest.raises(RuntimeError):
+        writer.submit_row(row(6))
+
+
+def test_submit_rejects_when_full_or_not_running(insert):
+    writer = BufferedWriter(max_queue=1)
+    with pytest.raises(RuntimeError):
+        writer.submit_row(row(1))
+    insert.release.clear()
+    writer.start()
+    writer.submit_row(row(1))
+    # Simulate a queue at capacity.
+    with mock.patch.object(writer._queue, "put_nowait", side_effect=ingest_buffer.queue.Full):
+        with pytest.raises(BufferFull):
+            writer.submit_row(row(2))
+    insert.release.set()
+    writer.stop()
+
+
+def test_copy_mode_fails_batch_when_connection_is_refused():
+    writer = BufferedWriter(flush_interval=0.05, method="copy")
+    engine = mock.Mock()
+    engine.raw_connection.side_effect = OSError("connection refused")
+    with mock.patch("db_helpers.get_engine", return_value=engine):
+        writer.start()
+        future = writer.submit_row(row(1))
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+        assert writer._thread.is_alive()
+        writer.stop()
+
+
+def test_copy_mode_reports_duplicates_for_deduplicated_rows(insert):
+    committed = []
+    writer = BufferedWriter(flush_interval=0.05, method="copy",
+                            on_commit=lambda ids, count: committed.append((ids, count)))
+    with mock.patch.object(ingest_buffer, "insert_raw_payloads",
+                           lambda rows: [11, DUPLICATE][:len(rows)]), \
+            mock.patch.object(ingest_buffer, "copy_raw_payloads") as copy:
+        writer.start()
+        futures = [writer.submit_row(row(1, b"a")), writer.submit_row(row(2, b"b"))]
+        results = [future.result(timeout=5) for future in futures]
+        writer.stop()
+    copy.assert_not_called()
+    assert results == [11, DUPLICATE]
+    assert committed == [([11], 1)]
@@ -0,0 +1,29 @@
+# tests/test_metrics.py
+import os
+import sys
+import subprocess
+
+from settings import Config
+from metrics import metrics_status
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_metrics_hidden_by_default():
+    assert metrics_status(Config(), None) == 404
+    assert metrics_status(Config(metrics_enabled=True), None) == 200
+
+
+def test_metrics_token_required_when_set():
+    config = Config(metrics_enabled=True, metrics_token="s3cret")
+    assert metrics_status(config, None) == 401
+    assert metrics_status(config, "Bearer wrong") == 401
+    assert metrics_status(config, "Bearer s3cret") == 200
+
+
+def test_prometheus_client_not_imported_with_library_modules():
+    code = ("import sys, metrics, dag_trigger, helius_api; "
+            "assert 'prometheus_client' not in sys.modules; "
+            "metrics.count_error('parse'); "
+            "assert 'prometheus_client' in sys.modules")
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT)
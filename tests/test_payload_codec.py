@@ -0,0 +1,69 @@
+# tests/test_payload_codec.py
+from datetime import datetime
+from unittest import mock
+
+import pytest
+
+import payload_codec
+from payload_codec import build_raw_row, decompress, loads, payload_text, validate_body
+
+BODY = b'[{"signature": "abc", "slot": 1, "description": "caf\xc3\xa9"}]'
+RECEIVED_AT = datetime(2024, 1, 1)
+
+
+@pytest.mark.parametrize("body", [b"", b" \r\n\t", b"hello", b'"text"', b"[1, 2}", b"null"])
+def test_validate_body_rejects_non_json_containers(body):
+    with pytest.raises(ValueError):
+        validate_body(body)
+
+
+def test_validate_body_parses_only_in_strict_mode():
+    truncated = b'[{"signature": "abc"}, ]'
+    validate_body(b'  {"a": 1}\n')
+    validate_body(truncated)
+    validate_body(BODY, strict=True)
+    with pytest.raises(ValueError):
+        validate_body(truncated, strict=True)
+
+
+def compressions():
+    available = ["none", "gzip"]
+    if payload_codec.zstandard is not None:
+        available.append("zstd")
+    return available
+
+
+@pytest.mark.parametrize("compression", compressions())
+def test_build_raw_row_round_trips(compression):
+    row = build_raw_row(BODY, compression, received_at=RECEIVED_AT)
+    assert row["received_at"] == RECEIVED_AT
+    # psycopg returns bytea columns as memoryview.
+    raw = row.get("payload_raw")
+    text = payload_text(row["payload"], None if raw is None else memoryview(raw),
+                        row.get("payload_encoding"))
+    assert text == BODY.decode("utf-8")
+    assert loads(text) == loads(BODY)
+
+
+def test_build_raw_row_stores_compressed_bodies_in_payload_raw():
+    row = build_raw_row(BODY, "gzip", level=1, received_at=RECEIVED_AT)
+    assert row["payload"] is None
+    assert row["payload_encoding"] == "gzip"
+    assert decompress(row["payload_raw"], "gzip") == BODY
+
+
+def test_unknown_encodings_raise_value_error():
+    with pytest.raises(ValueError):
+        decompress(b"data", "brotli")
+    with pytest.raises(ValueError):
+        payload_codec.compress(BODY, "brotli")
+
+
+def test_unknown_or_unavailable_compression_falls_back():
+    payload_codec._effective_compression.cache_clear()
+    try:
+        assert payload_codec._effective_compression("brotli") == "none"
+        with mock.patch.object(payload_codec, "zstandard", None):
+            assert payload_codec._effective_compression("zstd") == "gzip"
+    finally:
+        payload_codec._effective_compression.cache_clear()
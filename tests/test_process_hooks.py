@@ -0,0 +1,106 @@
+# tests/test_process_hooks.py
+import gzip
+from datetime import datetime, timezone
+from unittest import mock
+
+import pytest
+from sqlalchemy.exc import DataError, OperationalError
+
+import process_hooks
+from process_hooks import explode_payload, transaction_row, upsert_rows
+
+
+def transaction(signature, **fields):
+    return dict({"signature": signature, "slot": 5, "timestamp": 1700000000,
+                 "type": "SWAP", "feePayer": "payer"}, **fields)
+
+
+def test_transaction_row_maps_fields():
+    row = transaction_row(7, transaction("sig", tokenTransfers=[{"amount": 1}]))
+    assert row["signature"] == "sig" and row["raw_id"] == 7
+    assert row["block_time"] == datetime.fromtimestamp(1700000000, tz=timezone.utc)
+    assert row["fee_payer"] == "payer"
+    assert row["token_transfers"] == [{"amount": 1}]
+    assert row["native_transfers"] == []
+    assert transaction_row(7, {"slot": 1}) is None
+
+
+def test_transaction_row_accepts_numeric_string_timestamp():
+    row = transaction_row(1, transaction("sig", timestamp="1700000000"))
+    assert row["block_time"].year == 2023
+    with pytest.raises(ValueError):
+        transaction_row(1, transaction("sig", timestamp="yesterday"))
+
+
+def test_explode_payload_handles_lists_and_single_transactions():
+    payload = [transaction("a"), "junk", {"no": "signature"}, transaction("b")]
+    assert [row["signature"] for row in explode_payload(1, payload)] == ["a", "b"]
+    assert [row["signature"] for row in explode_payload(1, transaction("c"))] == ["c"]
+
+
+class FakeConnection:
+    """
+    Records statements; begin_nested() stands in for a savepoint.
+    """
+
+    def __init__(self):
+        self.executed = []
+
+    def begin_nested(self):
+        return mock.MagicMock()
+
+    def execute(self, statement):
+        self.executed.append(statement)
+
+
+def data_error():
+    return DataError("INSERT ...", {}, Exception("invalid input syntax for type bigint"))
+
+
+def test_upsert_rows_dead_letters_only_rejected_rows():
+    connection = FakeConnection()
+    rows_by_id = {1: [{"signature": "a"}], 2: [{"signature": "bad"}], 3: []}
+
+    def upsert(connection, rows):
+        if any(row["signature"] == "bad" for row in rows):
+            raise data_error()
+
+    with mock.patch.object(process_hooks, "upsert_transactions", side_effect=upsert), \
+            mock.patch.object(process_hooks, "dead_letter") as dead_letter:
+        assert upsert_rows(connection, rows_by_id) == [1, 3]
+    assert [call.args[1] for call in dead_letter.call_args_list] == [2]
+
+
+def test_upsert_rows_propagates_connection_errors():
+    error = OperationalError("INSERT ...", {}, Exception("server closed the connection"))
+    with mock.patch.object(process_hooks, "upsert_transactions", side_effect=error):
+        with pytest.raises(OperationalError):
+            upsert_rows(FakeConnection(), {1: [{"signature": "a"}]})
+
+
+def test_process_chunk_dead_letters_corrupt_rows_and_keeps_going():
+    good = gzip.compress(b'[{"signature": "ok", "timestamp": 1700000000}]')
+    claimed_rows = [
+        (1, None, good, "gzip"),
+        (2, None, b"not gzip at all", "gzip"),
+        (3, None, good[:10], "gzip"),
+        (4, '[{"signature": "bad-time", "timestamp": "soon"}]', None, None),
+        (5, '{"signature": "plain"}', None, None),
+    ]
+    connection = mock.MagicMock()
+    result = connection.execution_options.return_value.execute.return_value
+    result.partitions.return_value = [claimed_rows]
+    begin = mock.MagicMock()
+    begin.return_value.__enter__.return_value = connection
+    stored = {}
+
+    def upsert_rows(connection, rows_by_id):
+        stored.update(rows_by_id)
+        return list(rows_by_id)
+
+    with mock.patch.object(process_hooks, "begin", begin), \
+            mock.patch.object(process_hooks, "upsert_rows", side_effect=upsert_rows), \
+            mock.patch.object(process_hooks, "dead_letter") as dead_letter:
+        assert process_hooks.process_chunk() == (5, 5, 2)
+    assert sorted(stored) == [1, 5]
+    assert sorted(call.args[1] for call in dead_letter.call_args_list) == [2, 3, 4]
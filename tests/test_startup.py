@@ -0,0 +1,13 @@
+# tests/test_startup.py
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_listener_imports_defer_sqlalchemy():
+    code = ("import sys, app, asgi_app, db_helpers; "
+            "assert 'sqlalchemy' not in sys.modules, 'sqlalchemy imported at start-up'")
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT,
+                   stdout=subprocess.DEVNULL)